@@ -0,0 +1,75 @@
+"""
+Стоимость выбора обработчика для одного входящего сообщения: ``CommandRouter``
+против цепочки регулярных выражений, которую pyrogram проверяет по одной на каждый
+``MessageHandler`` (как было до роутера), в зависимости от числа команд.
+
+    python -m benchmarks.dispatch
+"""
+import random
+import re
+import time
+
+from router import CommandRouter
+
+MESSAGES = 100_000
+USERNAME = "shmafiabot"
+CHAT_MESSAGES = [
+    "ахахах", "да", "нет", "кто ведущий?", "ну давай уже", "Привет всем, как дела?", "))))",
+    "амш кто сегодня молодец", "шар будет ли завтра пара", "@все го играть", "/help", "/config",
+]
+
+
+async def handler(_, __):
+    pass
+
+
+def command_names(count: int):
+    return [f"command{i}" for i in range(count)]
+
+
+def linear_chain(names):
+    """Регулярные выражения в том виде, в каком их строит ``filters.command``."""
+    return [re.compile(rf"^(?:/)({name})(?:@?{USERNAME})?(?:\s|$)", re.IGNORECASE) for name in names]
+
+
+def router_for(names) -> CommandRouter:
+    router = CommandRouter()
+    for name in names:
+        router.command(name, handler)
+    router.text(["@все", "@all", "шар"], handler)
+    router.prefixed_command(["амш", "ашм"], ["кто", "d20", "антипара дня"], handler)
+    return router
+
+
+def messages_for(names):
+    pool = CHAT_MESSAGES + [f"/{name} аргумент" for name in random.sample(names, min(10, len(names)))]
+    return [random.choice(pool) for _ in range(MESSAGES)]
+
+
+def measure_chain(chain, messages) -> float:
+    start = time.perf_counter()
+    for text in messages:
+        for pattern in chain:
+            if pattern.match(text):
+                break
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def measure_router(router: CommandRouter, messages) -> float:
+    start = time.perf_counter()
+    for text in messages:
+        router.match(text, USERNAME)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    for count in (10, 100, 1000):
+        names = command_names(count)
+        messages = messages_for(names)
+        chain = measure_chain(linear_chain(names), messages)
+        router = measure_router(router_for(names), messages)
+        print(f"{count:>5} commands: chain {chain:8.2f} µs/message, router {router:.2f} µs/message")
+
+
+if __name__ == '__main__':
+    main()
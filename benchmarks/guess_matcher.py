@@ -0,0 +1,46 @@
+"""
+Стоимость проверки одного сообщения чата на отгадку в крокодиле:
+точный ``GuessMatcher`` и ``FuzzyGuessMatcher`` с допуском опечаток.
+
+    python -m benchmarks.guess_matcher
+"""
+import random
+import time
+
+from crocodile import GuessMatcher, FuzzyGuessMatcher
+from crocodile_words import Words
+
+MESSAGES = 200_000
+CHAT_MESSAGES = [
+    "ахахах", "да", "нет", "кто ведущий?", "ну давай уже", "это животное?", "чайник", "самолет",
+    "Привет всем, как дела?", "а можно подсказку", "))))", "не понял", "шампун", "шампанское",
+    "что это вообще такое", "правдоискатель", "омбудсмен", "ракетчик", "затычка", "турист!",
+]
+
+
+def messages_for(word: str):
+    typos = [word[:-1], word + "ы", word[1:], word[::-1]]
+    pool = CHAT_MESSAGES + typos
+    return [random.choice(pool) for _ in range(MESSAGES)]
+
+
+def measure(matcher_class, words) -> float:
+    total = 0.0
+    for word in words:
+        matcher = matcher_class(word)
+        messages = messages_for(word)
+        start = time.perf_counter()
+        for text in messages:
+            matcher.matches(text)
+        total += time.perf_counter() - start
+    return total / (len(words) * MESSAGES) * 1e6
+
+
+def main():
+    words = random.sample(Words.ALL, 10)
+    for matcher_class in (GuessMatcher, FuzzyGuessMatcher):
+        print(f"{matcher_class.__name__:>18}: {measure(matcher_class, words):.2f} µs/message")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Задержка (p50/p99) и пропускная способность каждого обработчика ``ShmafiaBot``
+на фейковом Telegram (``benchmarks.harness``) и SQLite. У селфбот-модерации в замер входит
+и отложенное удаление (сброс ``ModerationQueue`` и сессий рыбалки), иначе окно в 1 с и таймаут
+рыбалки не истекают за время прогона.
+
+    python -m benchmarks.handlers [итераций] [задержка API, мс] [доля FloodWait]
+"""
+import asyncio
+import itertools
+import sys
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+from pyrogram import types
+
+from benchmarks.harness import Harness
+from config_cache import ConfigKey
+from metrics import metrics
+from fishing import FISHING_BOT_ID
+from shmafiabot import CrocodileGame, PIPISA_BOT_ID
+
+ITERATIONS = 200
+
+
+class Scenario(NamedTuple):
+    name: str
+    update: Callable[[Harness], object]
+    setup: Optional[Callable[[Harness], Awaitable]] = None
+    selfbot: bool = False
+    flush: Optional[Callable[[Harness], Awaitable]] = None  # deferred work timed together with the update
+
+
+def handler_calls(name: str) -> int:
+    return histogram.count if (histogram := metrics.families['handler'].get(name)) else 0
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+# region crocodile setups
+async def game_running(harness: Harness):
+    bot = harness.bot
+    if bot._crocodile_game(harness.chat_id) is None:
+        await harness.feed(harness.message("/start_crocodile", user=harness.users[0]))
+    game = bot._crocodile_game(harness.chat_id)
+    if game.presenter is None:
+        game.finish_handoff(harness.users[0])
+
+
+async def game_stopped(harness: Harness):
+    if harness.bot._crocodile_game(harness.chat_id) is not None:
+        await harness.feed(harness.message("/end_crocodile"))
+
+
+async def game_handoff(harness: Harness):
+    await game_running(harness)
+    game = harness.bot._crocodile_game(harness.chat_id)
+    guesser = next(user for user in harness.users if user.id != game.presenter.id)
+    await harness.feed(harness.message(game.word, user=guesser))
+
+
+def guess(harness: Harness) -> types.Message:
+    game = harness.bot._crocodile_game(harness.chat_id)
+    return harness.message(game.word, user=next(user for user in harness.users if user.id != game.presenter.id))
+
+
+def presenter_callback(data: str):
+    def update(harness: Harness) -> types.CallbackQuery:
+        return harness.callback_query(data, harness.bot._crocodile_game(harness.chat_id).presenter)
+    return update
+
+
+def become_presenter(harness: Harness) -> types.CallbackQuery:
+    game = harness.bot._crocodile_game(harness.chat_id)
+    return harness.callback_query(CrocodileGame.CallbackQueries.BECOME_PRESENTER, game.reserved_presenter or harness.users[1])
+# endregion
+
+
+async def mention_group(harness: Harness):
+    if harness.bot.mention_groups.members("dorm") is None:
+        await harness.bot.mention_groups.create_group("dorm")
+        await harness.bot.mention_groups.add_members("dorm", harness.users[::3])
+
+
+async def flush_moderation(harness: Harness):
+    state = harness.bot.chats.get(harness.chat_id)
+    for fisher_id in list(state.fishing_sessions):
+        await harness.bot._flush_fishing_session(state, fisher_id)
+    await harness.bot.moderation.flush_all()
+
+
+TRIGGER_COMMANDS = itertools.cycle(["/add_trigger_phrase bench бенч фраза", "/add_trigger_response bench бенч ответ", "/delete_trigger bench"])
+
+SCENARIOS = [
+    Scenario("help_command", lambda h: h.message("/help")),
+    Scenario("set_title_command", lambda h: h.message("/set_nametag плашка")),
+    Scenario("un_restrict_member_command", lambda h: h.message(
+        f"/{'un' if h.bot.permissions.is_restricted(h.users[1].id) else ''}restrict_member @{h.users[1].username}",
+        user=h.admin)),
+    Scenario("ping_all", lambda h: h.message("@все го играть")),
+    Scenario("ping_group", lambda h: h.message("@dorm го играть"), setup=mention_group),
+    Scenario("groups_command", lambda h: h.message("/groups"), setup=mention_group),
+    Scenario("manage_group_command", lambda h: h.message(f"/add_to_group dorm @{h.users[2].username}", user=h.admin), setup=mention_group),
+    Scenario("a8ball", lambda h: h.message("шар будет ли завтра пара?")),
+    Scenario("config_command", lambda h: h.message(f"/config {ConfigKey.ANTI_PIPISA_ADS}")),
+    Scenario("jobs_command", lambda h: h.message("/jobs", user=h.admin)),
+    Scenario("outbox_command", lambda h: h.message("/outbox", user=h.admin)),
+    Scenario("perf_command", lambda h: h.message("/perf", user=h.admin)),
+    Scenario("admins_command", lambda h: h.message("/admins", user=h.admin)),
+    Scenario("manage_admin_command", lambda h: h.message(
+        f"/{'remove' if h.bot.permissions.is_admin(h.chat_id, h.users[3].id) else 'add'}_admin @{h.users[3].username}",
+        user=h.admin)),
+    Scenario("d20", lambda h: h.message("амш d20")),
+    Scenario("whos_today", lambda h: h.message("амш кто сегодня молодец")),
+    Scenario("antipair", lambda h: h.message("амш антипара дня")),
+    Scenario("triggers_command", lambda h: h.message("/triggers")),
+    Scenario("trigger_reply", lambda h: h.message("ну когда фотки уже")),
+    Scenario("manage_trigger_command", lambda h: h.message(next(TRIGGER_COMMANDS), user=h.admin)),
+    Scenario("crocodile_start", lambda h: h.message("/start_crocodile"), setup=game_stopped),
+    Scenario("crocodile_end_game", lambda h: h.message("/end_crocodile"), setup=game_running),
+    Scenario("crocodile_show_word", presenter_callback(CrocodileGame.CallbackQueries.SHOW_WORD), setup=game_running),
+    Scenario("crocodile_repick_word", presenter_callback(CrocodileGame.CallbackQueries.NEXT_WORD), setup=game_running),
+    Scenario("crocodile_messages_listener", guess, setup=game_running),
+    Scenario("crocodile_become_presenter", become_presenter, setup=game_handoff),
+    Scenario("roster_member_updated", lambda h: h.member_updated(h.user())),
+    Scenario("roster_service_message", lambda h: h.message(new_chat_members=[h.user()])),
+    Scenario("fishing_msg_deletion", lambda h: h.message(
+        "🎣 [Рыбалка] 🎣\nВы получаете Карась\nЭнергии осталось: 3",
+        user=h.user(FISHING_BOT_ID, "fishing_bot"), client=h.bot.selfbot), selfbot=True, flush=flush_moderation),
+    Scenario("pipisa_bot_ad_remover", lambda h: h.message(
+        "реклама", user=h.user(PIPISA_BOT_ID, "pipisa_bot"), client=h.bot.selfbot,
+        reply_markup=types.InlineKeyboardMarkup([[types.InlineKeyboardButton("купить", url="https://t.me")]])),
+             selfbot=True, flush=flush_moderation),
+]
+
+
+async def run_scenario(harness: Harness, scenario: Scenario, iterations: int) -> List[float]:
+    durations = []
+    for _ in range(iterations):
+        if scenario.setup:
+            await scenario.setup(harness)
+        client = harness.bot.selfbot if scenario.selfbot else harness.bot.bot
+        calls = handler_calls(scenario.name)
+        start = time.perf_counter()
+        await harness.feed(scenario.update(harness), client)
+        if scenario.flush:
+            await scenario.flush(harness)
+        duration = time.perf_counter() - start
+        # the router's MessageHandler accepts every message, so check that the scenario's own handler ran
+        if handler_calls(scenario.name) == calls:
+            raise RuntimeError(f"{scenario.name}: the update did not reach the handler")
+        durations.append(duration)
+    return durations
+
+
+async def main(iterations: int, latency: float, flood_wait_rate: float):
+    harness = Harness(latency=latency, jitter=latency / 4, flood_wait_rate=flood_wait_rate)
+    await harness.start()
+    for key in (ConfigKey.ANTI_FISHING, ConfigKey.ANTI_PIPISA_ADS):
+        await harness.bot.config.set(key, True, harness.chat_id)
+    try:
+        print(f"{'handler':>28} {'p50, ms':>9} {'p99, ms':>9} {'updates/s':>10}")
+        for scenario in SCENARIOS:
+            durations = await run_scenario(harness, scenario, iterations)
+            ordered = sorted(durations)
+            print(f"{scenario.name:>28} {percentile(ordered, 0.5) * 1000:9.2f} {percentile(ordered, 0.99) * 1000:9.2f} "
+                  f"{len(durations) / sum(durations):10.0f}")
+        print(f"\nTelegram API calls: {harness.bot.bot.calls}")
+    finally:
+        await harness.stop()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if args else ITERATIONS,
+        float(args[1]) / 1000 if len(args) > 1 else 0.0,
+        float(args[2]) if len(args) > 2 else 0.0,
+    ))
@@ -0,0 +1,211 @@
+"""
+Бот без Telegram и Postgres: ``FakeTelegram`` заменяет ``pyrogram.Client`` в тех местах,
+которые использует ``ShmafiaBot``, а ``Harness`` поднимает бота на временной базе SQLite
+и подает ему синтетические обновления через те же обработчики, что регистрирует ``run``.
+
+    harness = Harness(members=50, latency=0.02, flood_wait_rate=0.01)
+    await harness.start()
+    await harness.feed(harness.message("@все"))
+    await harness.stop()
+
+Модуль подменяет ``DATABASE_URL`` и ``CHAT_IDS``, поэтому импортируется до ``db`` и ``shmafiabot``.
+"""
+import asyncio
+import itertools
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+HARNESS_CHAT_ID = -1001000000001
+HARNESS_CHAT_IDS = [HARNESS_CHAT_ID - i for i in range(int(os.getenv('HARNESS_CHATS', 16)))]
+os.environ['CHAT_IDS'] = ','.join(map(str, HARNESS_CHAT_IDS))
+os.environ['DATABASE_URL'] = os.getenv(
+    'HARNESS_DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='shmafiabot-'), 'harness.db')}"
+)
+
+from pyrogram import types  # noqa: E402
+from pyrogram.enums import ChatMemberStatus, ChatType, MessageEntityType, ParseMode  # noqa: E402
+from pyrogram.errors import FloodWait, UserNotParticipant  # noqa: E402
+from pyrogram.handlers import CallbackQueryHandler, ChatMemberUpdatedHandler, MessageHandler  # noqa: E402
+
+import db  # noqa: E402
+from permissions import BOOTSTRAP_ADMIN_IDS  # noqa: E402
+from shmafiabot import ShmafiaBot  # noqa: E402
+
+MODELS = [db.User, db.MentionGroup, db.GroupAffiliation, db.RestrictedUser, db.BotAdmin, db.Config, db.ChatConfig,
+          db.CrocodileWordHistory, db.Trigger, db.TriggerPhrase, db.TriggerResponse]
+HANDLER_UPDATE_TYPES = {
+    MessageHandler: types.Message,
+    CallbackQueryHandler: types.CallbackQuery,
+    ChatMemberUpdatedHandler: types.ChatMemberUpdated,
+}
+MENTION_RE = re.compile(r"@[A-Za-z0-9_]{5,32}")
+CHAT_MEMBERS_PAGE = 200
+
+
+class FakeTelegram:
+    """
+    Стенд-ин ``pyrogram.Client``: хранит участников чатов в памяти, отвечает на вызовы API
+    с задержкой ``latency`` (± ``jitter``) и с вероятностью ``flood_wait_rate`` бросает ``FloodWait``.
+    """
+    parse_mode = ParseMode.DEFAULT  # read by User.mention
+
+    def __init__(self, name: str, username: str, latency: float = 0.0, jitter: float = 0.0,
+                 flood_wait_rate: float = 0.0, flood_wait: int = 1):
+        self.name = name
+        self.me = types.User(id=random.randint(10 ** 9, 2 * 10 ** 9), is_bot=True, first_name=name, username=username, client=self)
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_wait_rate = flood_wait_rate
+        self.flood_wait = flood_wait
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{name}-filters')
+        self.handlers: Dict[int, list] = {}
+        self.members: Dict[int, Dict[int, types.User]] = {}
+        self.admins: Dict[int, set] = {}
+        self.calls: Dict[str, int] = {}
+        self.sent: List[types.Message] = []
+        self._message_ids = itertools.count(1)
+
+    # region pyrogram.Client surface
+    def add_handler(self, handler, group: int = 0):
+        self.handlers.setdefault(group, []).append(handler)
+
+    async def _api(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if self.flood_wait_rate and random.random() < self.flood_wait_rate:
+            raise FloodWait(value=self.flood_wait)
+
+    def chat(self, chat_id: int) -> types.Chat:
+        return types.Chat(id=chat_id, type=ChatType.SUPERGROUP, title="harness", client=self)
+
+    async def send_message(self, chat_id: int, text: str, reply_to_message_id: int = None, **kwargs) -> types.Message:
+        await self._api('send_message')
+        message = types.Message(id=next(self._message_ids), chat=self.chat(chat_id), from_user=self.me, date=datetime.now(),
+                                text=text, reply_markup=kwargs.get('reply_markup'), client=self)
+        self.sent.append(message)
+        return message
+
+    async def delete_messages(self, chat_id: int, message_ids: Union[int, List[int]], revoke: bool = True) -> int:
+        await self._api('delete_messages')
+        return 1 if isinstance(message_ids, int) else len(message_ids)
+
+    async def get_chat_members(self, chat_id: int, *args, **kwargs):
+        users = list(self.members.get(chat_id, {}).values())
+        for offset in range(0, len(users), CHAT_MEMBERS_PAGE):
+            await self._api('get_chat_members')
+            for user in users[offset:offset + CHAT_MEMBERS_PAGE]:
+                yield types.ChatMember(status=ChatMemberStatus.MEMBER, user=user, client=self)
+
+    async def get_chat_member(self, chat_id: int, user_id: Union[int, str]) -> types.ChatMember:
+        await self._api('get_chat_member')
+        members = self.members.get(chat_id, {})
+        if isinstance(user_id, str):
+            username = user_id.lstrip('@').lower()
+            user = next((user for user in members.values() if user.username and user.username.lower() == username), None)
+        else:
+            user = members.get(user_id)
+        if user is None:
+            raise UserNotParticipant()
+        return types.ChatMember(status=ChatMemberStatus.MEMBER, user=user, client=self)
+
+    async def promote_chat_member(self, chat_id: int, user_id: int, privileges=None) -> bool:
+        await self._api('promote_chat_member')
+        self.admins.setdefault(chat_id, set()).add(user_id)
+        return True
+
+    async def set_administrator_title(self, chat_id: int, user_id: int, title: str) -> bool:
+        await self._api('set_administrator_title')
+        if user_id not in self.admins.get(chat_id, set()):
+            raise ValueError(f'The user {user_id} must be an administrator')
+        return True
+
+    async def answer_callback_query(self, callback_query_id: str, text: str = None, show_alert: bool = None, **kwargs) -> bool:
+        await self._api('answer_callback_query')
+        return True
+    # endregion
+
+    async def dispatch(self, update) -> int:
+        """Передать обновление обработчикам так же, как диспетчер pyrogram: в каждой группе — первому подходящему."""
+        self.loop = self.loop or asyncio.get_running_loop()
+        handled = 0
+        for group in sorted(self.handlers):
+            for handler in self.handlers[group]:
+                if isinstance(update, HANDLER_UPDATE_TYPES[type(handler)]) and await handler.check(self, update):
+                    await handler.callback(self, update)
+                    handled += 1
+                    break
+        return handled
+
+
+class Harness:
+    """``ShmafiaBot`` с фейковыми клиентами, временной базой и синтетическими участниками чата."""
+
+    def __init__(self, members: int = 50, latency: float = 0.0, jitter: float = 0.0, flood_wait_rate: float = 0.0,
+                 rate_limits: bool = False, cooldowns: bool = False, chat_id: int = HARNESS_CHAT_ID):
+        self.chat_id = chat_id
+        self.bot = ShmafiaBot("harness")
+        self.bot.bot = FakeTelegram("harness", "shmafiabot", latency, jitter, flood_wait_rate)
+        self.bot.selfbot = FakeTelegram("harness_selfbot", "shmafia_selfbot", latency, jitter, flood_wait_rate)
+        if not rate_limits:
+            self.bot.outbox.PER_CHAT_RATE = self.bot.outbox.PER_CHAT_BURST = 10 ** 6
+            self.bot.outbox.GLOBAL_RATE = self.bot.outbox.GLOBAL_BURST = 10 ** 6
+        if not cooldowns:
+            self.bot.cooldowns.rules = {}
+        self._message_ids = itertools.count(1)
+        self._user_ids = itertools.count(10 ** 6)
+        self.admin = self.user(BOOTSTRAP_ADMIN_IDS[0], "harness_admin")
+        self.users = [self.user() for _ in range(members)]
+        self.add_members(chat_id, [self.admin, *self.users])
+
+    def user(self, user_id: int = None, username: str = None, is_bot: bool = False) -> types.User:
+        user_id = user_id or next(self._user_ids)
+        return types.User(id=user_id, is_bot=is_bot, first_name=f"User {user_id}", username=username or f"user{user_id}",
+                          client=self.bot.bot)
+
+    def add_members(self, chat_id: int, users: List[types.User]):
+        for client in (self.bot.bot, self.bot.selfbot):
+            client.members.setdefault(chat_id, {}).update((user.id, user) for user in users)
+
+    async def start(self):
+        db.db.create_tables(MODELS)
+        self.bot._add_handlers()
+        await self.bot._start_services()
+
+    async def stop(self):
+        await self.bot.loop_monitor.stop()
+        await self.bot.scheduler.stop()
+
+    def message(self, text: str = None, user: types.User = None, chat_id: int = None, client: FakeTelegram = None,
+                entities: List[types.MessageEntity] = None, **kwargs) -> types.Message:
+        client = client or self.bot.bot
+        if entities is None and text:
+            entities = [types.MessageEntity(type=MessageEntityType.MENTION, offset=match.start(), length=len(match[0]))
+                        for match in MENTION_RE.finditer(text)]
+        return types.Message(id=next(self._message_ids), chat=client.chat(chat_id or self.chat_id),
+                             from_user=user or random.choice(self.users), date=datetime.now(), text=text,
+                             entities=entities or None, client=client, **kwargs)
+
+    def callback_query(self, data: str, user: types.User, message: types.Message = None, chat_id: int = None) -> types.CallbackQuery:
+        message = message or self.message("", user=self.bot.bot.me, chat_id=chat_id)
+        return types.CallbackQuery(id=str(next(self._message_ids)), from_user=user, chat_instance=str(message.chat.id),
+                                   message=message, data=data, client=self.bot.bot)
+
+    def member_updated(self, user: types.User, joined: bool = True) -> types.ChatMemberUpdated:
+        status = ChatMemberStatus.MEMBER if joined else ChatMemberStatus.LEFT
+        return types.ChatMemberUpdated(chat=self.bot.bot.chat(self.chat_id), from_user=user, date=datetime.now(),
+                                       old_chat_member=None, new_chat_member=types.ChatMember(status=status, user=user),
+                                       client=self.bot.bot)
+
+    async def feed(self, update, client: FakeTelegram = None) -> Tuple[int, float]:
+        """Обработать обновление до конца; возвращает число сработавших обработчиков и время в секундах."""
+        start = time.perf_counter()
+        handled = await (client or self.bot.bot).dispatch(update)
+        return handled, time.perf_counter() - start
@@ -0,0 +1,195 @@
+"""
+Нагрузочный тест: много участников в одном или нескольких чатах играют в крокодила,
+пишут в чат, зовут ``@все``/``@общажники`` и переключают ``/config``. Обновления
+поступают с заданной частотой (пуассоновский поток, не дожидаясь ответов), частота
+растет ступенями; для каждой ступени печатаются пропускная способность, p50/p99
+задержки от поступления до конца обработки и число обновлений, не обработанных
+через ``BEHIND_P99`` после конца ступени (на это время поступление приостанавливается).
+
+    python -m benchmarks.load [--chats 4] [--members 200] [--rates 10,50,100,200,500] [--stage 10] [--latency 50]
+"""
+import argparse
+import asyncio
+import random
+import traceback
+from typing import Callable, Dict, List, Tuple
+
+from pyrogram import types
+
+from benchmarks.harness import Harness, FakeTelegram, HARNESS_CHAT_IDS
+from config_cache import ConfigKey
+from mention_groups import DORM_GROUP
+from metrics import metrics
+from shmafiabot import CrocodileGame
+
+CHATTER = [
+    "ахахах", "да", "нет", "кто ведущий?", "ну давай уже", "это животное?", "Привет всем, как дела?",
+    "а можно подсказку", "))))", "не понял", "что это вообще такое", "шар будет ли завтра пара?", "амш кто молодец",
+]
+BEHIND_P99 = 1.0  # a stage with a higher p99 (seconds) counts as falling behind
+BEHIND_THROUGHPUT = 0.95  # as does a stage that completes less than this share of the updates it offered
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class ChatSimulation:
+    """Участники одного чата; ``next_update`` выбирает их следующее действие."""
+    ACTIONS: List[Tuple[str, float]] = [("crocodile", 0.6), ("chatter", 0.3), ("ping_all", 0.02), ("ping_group", 0.03), ("config", 0.05)]
+
+    def __init__(self, harness: Harness, chat_id: int, members: List[types.User]):
+        self.harness = harness
+        self.chat_id = chat_id
+        self.members = members
+        self.actions: Dict[str, Callable[[], Tuple[str, object]]] = {
+            "crocodile": self.crocodile, "chatter": self.chatter, "ping_all": self.ping_all,
+            "ping_group": self.ping_group, "config": self.config,
+        }
+
+    def message(self, text: str, user: types.User = None) -> types.Message:
+        return self.harness.message(text, user=user or random.choice(self.members), chat_id=self.chat_id)
+
+    def callback(self, data: str, user: types.User) -> types.CallbackQuery:
+        return self.harness.callback_query(data, user, chat_id=self.chat_id)
+
+    def next_update(self) -> Tuple[str, object]:
+        names, weights = zip(*self.ACTIONS)
+        return self.actions[random.choices(names, weights)[0]]()
+
+    def crocodile(self) -> Tuple[str, object]:
+        if (game := self.harness.bot._crocodile_game(self.chat_id)) is None:
+            return "crocodile_start", self.message("/start_crocodile")
+        if game.presenter is None:
+            return "crocodile_become_presenter", self.callback(CrocodileGame.CallbackQueries.BECOME_PRESENTER,
+                                                               game.reserved_presenter or random.choice(self.members))
+        roll = random.random()
+        if roll < 0.05:
+            return "crocodile_show_word", self.callback(CrocodileGame.CallbackQueries.SHOW_WORD, game.presenter)
+        if roll < 0.08:
+            return "crocodile_repick_word", self.callback(CrocodileGame.CallbackQueries.NEXT_WORD, game.presenter)
+        guesser = random.choice([user for user in self.members[:20] if user.id != game.presenter.id])
+        if roll < 0.2:
+            return "crocodile_guess", self.message(game.word, guesser)
+        return "crocodile_miss", self.message(random.choice(CHATTER), guesser)
+
+    def chatter(self) -> Tuple[str, object]:
+        return "chatter", self.message(random.choice(CHATTER))
+
+    def ping_all(self) -> Tuple[str, object]:
+        return "ping_all", self.message("@все го играть")
+
+    def ping_group(self) -> Tuple[str, object]:
+        return "ping_group", self.message(f"@{DORM_GROUP} кто дома?")
+
+    def config(self) -> Tuple[str, object]:
+        return "config", self.message(f"/config {ConfigKey.ANTI_FISHING}")
+
+
+class StageStats:
+    """Итоги обновлений, поступивших за одну ступень, — даже если они закончились после нее."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+        self.completed = 0
+        self.offered = 0
+        self.tasks: set = set()
+
+
+class LoadGenerator:
+    def __init__(self, harness: Harness, chats: List[ChatSimulation]):
+        self.harness = harness
+        self.chats = chats
+
+    async def _deliver(self, stats: StageStats, action: str, update, client: FakeTelegram, arrived_at: float):
+        loop = asyncio.get_running_loop()
+        try:
+            await self.harness.feed(update, client)
+        except Exception:
+            if action not in stats.failures:
+                print(f"{action} failed:")
+                traceback.print_exc()
+            stats.failures[action] = stats.failures.get(action, 0) + 1
+        else:
+            stats.completed += 1
+            stats.latencies.setdefault(action, []).append(loop.time() - arrived_at)
+
+    async def stage(self, rate: float, duration: float, stats: StageStats) -> float:
+        loop = asyncio.get_running_loop()
+        started_at = next_at = loop.time()
+        while next_at < started_at + duration:
+            if (delay := next_at - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            action, update = random.choice(self.chats).next_update()
+            task = asyncio.create_task(self._deliver(stats, action, update, self.harness.bot.bot, next_at))
+            stats.tasks.add(task)
+            task.add_done_callback(stats.tasks.discard)
+            stats.offered += 1
+            next_at += random.expovariate(rate)
+        return loop.time() - started_at
+
+    async def run(self, rates: List[float], duration: float):
+        behind_at = None
+        failed_stages = []
+        late_tasks: set = set()
+        print(f"{'offered/s':>10} {'done/s':>8} {'p50, ms':>9} {'p99, ms':>9} {'failed':>7} {'late':>5} {'loop lag p99, ms':>17}")
+        for rate in rates:
+            stats = StageStats()
+            elapsed = await self.stage(rate, duration, stats)
+            # updates of this stage still running get BEHIND_P99 to finish; the ones that do not are late
+            if stats.tasks:
+                await asyncio.wait(set(stats.tasks), timeout=BEHIND_P99)
+            late = len(stats.tasks)
+            late_tasks.update(stats.tasks)
+            ordered = sorted(latency for latencies in stats.latencies.values() for latency in latencies)
+            p99 = percentile(ordered, 0.99)
+            print(f"{rate:10.0f} {stats.completed / elapsed:8.1f} {percentile(ordered, 0.5) * 1000:9.1f} {p99 * 1000:9.1f} "
+                  f"{sum(stats.failures.values()):7d} {late:5d} {self.harness.bot.loop_monitor.lag.percentile(0.99) * 1000:17.1f}")
+            if stats.failures:
+                failed_stages.append(rate)
+                print('  failed: ' + ', '.join(f"{action} {count}" for action, count in sorted(stats.failures.items())))
+            elif behind_at is None and (p99 > BEHIND_P99 or stats.completed < stats.offered * BEHIND_THROUGHPUT):
+                behind_at = rate
+            if stats.latencies:
+                print('  ' + ', '.join(f"{action} p99 {percentile(sorted(latencies), 0.99) * 1000:.0f} ms"
+                                       for action, latencies in sorted(stats.latencies.items())))
+        if failed_stages:
+            print(f"\nUpdates failed at {', '.join(f'{rate:.0f}' for rate in failed_stages)} updates/s; "
+                  "these stages measure errors, not load, and are left out of the verdict")
+        print(f"\nThe bot falls behind at {behind_at:.0f} updates/s" if behind_at else "\nThe bot kept up with every error-free stage")
+        if late_tasks := {task for task in late_tasks if not task.done()}:
+            await asyncio.wait(late_tasks, timeout=duration)
+        print(f"\n{metrics.report()}")
+
+
+async def main(args: argparse.Namespace):
+    if args.chats > len(HARNESS_CHAT_IDS):
+        raise SystemExit(f"--chats is limited by HARNESS_CHATS={len(HARNESS_CHAT_IDS)}")
+    harness = Harness(members=0, latency=args.latency / 1000, jitter=args.latency / 4000,
+                      flood_wait_rate=args.flood_wait_rate, rate_limits=args.rate_limits, cooldowns=args.cooldowns)
+    await harness.start()
+    chats = []
+    for chat_id in HARNESS_CHAT_IDS[:args.chats]:
+        members = [harness.user() for _ in range(args.members)]
+        harness.add_members(chat_id, [harness.admin, *members])
+        chats.append(ChatSimulation(harness, chat_id, members))
+    await harness.bot.mention_groups.create_group(DORM_GROUP)
+    await harness.bot.mention_groups.add_members(DORM_GROUP, [user for chat in chats for user in chat.members[::4]])
+    try:
+        await LoadGenerator(harness, chats).run([float(rate) for rate in args.rates.split(',')], args.stage)
+    finally:
+        await harness.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chats', type=int, default=1)
+    parser.add_argument('--members', type=int, default=200, help="участников в каждом чате")
+    parser.add_argument('--rates', default="10,50,100,200,500", help="ступени частоты обновлений, в секунду")
+    parser.add_argument('--stage', type=float, default=10, help="длительность ступени, с")
+    parser.add_argument('--latency', type=float, default=50, help="задержка фейкового API, мс")
+    parser.add_argument('--flood-wait-rate', type=float, default=0)
+    parser.add_argument('--rate-limits', action='store_true', help="оставить ограничения очереди исходящих")
+    parser.add_argument('--cooldowns', action='store_true', help="оставить ограничения частоты команд")
+    asyncio.run(main(parser.parse_args()))
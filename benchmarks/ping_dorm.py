@@ -0,0 +1,68 @@
+"""
+Время сборки упоминаний для ``@общажники`` в зависимости от размера чата:
+по запросу на участника (как было) и через ``MentionGroupIndex``.
+
+    python -m benchmarks.ping_dorm
+
+Бенчмарк пересоздает таблицы, поэтому всегда работает на временной базе SQLite, а не на ``DATABASE_URL``.
+"""
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='shmafiabot-'), 'ping_dorm.db')}"
+
+from db import db, User, MentionGroup, GroupAffiliation  # noqa: E402
+from mention_groups import MentionGroupIndex  # noqa: E402
+
+ROSTER_SIZES = [50, 200, 1000, 5000]
+AFFILIATED_SHARE = 0.3
+REPEATS = 5
+
+
+def setup(size: int):
+    db.drop_tables([GroupAffiliation, MentionGroup, User])
+    db.create_tables([User, MentionGroup, GroupAffiliation])
+    group = MentionGroup.create(name="общажники")
+    users = []
+    with db.atomic():
+        for user_id in range(1, size + 1):
+            User.create(user_id=user_id, username=f"user{user_id}", first_name=f"User {user_id}", last_name="")
+            users.append(SimpleNamespace(id=user_id, mention=f"@user{user_id}"))
+        for user_id in random.sample(range(1, size + 1), int(size * AFFILIATED_SHARE)):
+            GroupAffiliation.create(mention_group_id=group.id, user_id=user_id)
+    return users
+
+
+def per_member_queries(users):
+    return [user.mention for user in users if GroupAffiliation.get_or_none(GroupAffiliation.user_id == user.id)]
+
+
+def preloaded_index(users):
+    members = MentionGroupIndex().members("общажники")
+    return [user.mention for user in users if user.id in members]
+
+
+def measure(func, users) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(users)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print(f"{'members':>8} {'before, ms':>12} {'after, ms':>12} {'speedup':>8}")
+    for size in ROSTER_SIZES:
+        users = setup(size)
+        assert per_member_queries(users) == preloaded_index(users)
+        before = measure(per_member_queries, users)
+        after = measure(preloaded_index, users)
+        print(f"{size:>8} {before:>12.2f} {after:>12.2f} {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
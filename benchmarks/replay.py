@@ -0,0 +1,136 @@
+"""
+Воспроизведение записи ``RECORD_UPDATES`` (``recorder.UpdateRecorder``) через обработчики
+бота на фейковом Telegram (``benchmarks.harness``): в записанном темпе или без пауз,
+по желанию под ``cProfile``. Все чаты записи сводятся в один чат стенда.
+
+    python -m benchmarks.replay updates.jsonl [--speed 1] [--latency 50] [--profile replay.prof]
+
+``--speed 0`` — без пауз, обновления обрабатываются по одному; иначе обновления запускаются
+параллельно в записанные моменты времени, ускоренные в ``speed`` раз.
+"""
+import argparse
+import asyncio
+import cProfile
+import glob
+import json
+import pstats
+from typing import Any, Dict, Iterator, List, Optional
+
+from pyrogram import types
+from pyrogram.enums import ChatMemberStatus, MessageEntityType, MessageMediaType
+
+from benchmarks.harness import Harness, FakeTelegram
+from metrics import metrics
+
+PROFILE_TOP = 30
+
+
+def capture_files(path: str) -> List[str]:
+    """Файлы записи от старых к новым: ``path.N``, …, ``path.1``, ``path``."""
+    rotated = [name for name in glob.glob(f"{glob.escape(path)}.*") if name.rsplit('.', 1)[1].isdigit()]
+    return sorted(rotated, key=lambda name: int(name.rsplit('.', 1)[1]), reverse=True) + [path]
+
+
+def read_capture(path: str) -> Iterator[Dict[str, Any]]:
+    for name in capture_files(path):
+        with open(name, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Replayer:
+    def __init__(self, harness: Harness):
+        self.harness = harness
+        self.users: Dict[int, types.User] = {}
+
+    def user(self, data: Optional[Dict[str, Any]]) -> Optional[types.User]:
+        if data is None:
+            return None
+        if (user := self.users.get(data['id'])) is None:
+            user = self.users[data['id']] = self.harness.user(data['id'], data.get('username'), is_bot=data.get('bot', False))
+            self.harness.add_members(self.harness.chat_id, [user])
+        return user
+
+    def message(self, data: Dict[str, Any], client: FakeTelegram) -> types.Message:
+        entities = [types.MessageEntity(type=MessageEntityType[kind], offset=offset, length=length, user=self.user(user))
+                    for kind, offset, length, user in data['entities'] or []]
+        reply_markup = None
+        if data['reply_markup'] == 'InlineKeyboardMarkup':
+            reply_markup = types.InlineKeyboardMarkup([[types.InlineKeyboardButton("…", callback_data="replay")]])
+        elif data['reply_markup'] == 'ReplyKeyboardMarkup':
+            reply_markup = types.ReplyKeyboardMarkup([["…"]])
+        has_caption = data['caption'] is not None
+        return self.harness.message(
+            data['text'], user=self.user(data['user']), client=client, entities=[] if has_caption else entities,
+            caption=data['caption'], caption_entities=entities if has_caption else None,
+            media=MessageMediaType[data['media']] if data['media'] else None, reply_markup=reply_markup,
+            new_chat_members=[self.user(user) for user in data['new_chat_members']] if data['new_chat_members'] else None,
+            left_chat_member=self.user(data['left_chat_member']),
+        )
+
+    def update(self, entry: Dict[str, Any]):
+        client = self.harness.bot.selfbot if entry['client'].endswith('_selfbot') else self.harness.bot.bot
+        match entry['kind']:
+            case 'message':
+                return client, self.message(entry, client)
+            case 'callback_query':
+                message = self.message(entry['message'], client) if entry['message'] else None
+                return client, self.harness.callback_query(entry['data'], self.user(entry['user']), message)
+            case 'chat_member':
+                joined = entry['status'] not in (None, ChatMemberStatus.LEFT.name, ChatMemberStatus.BANNED.name)
+                return client, self.harness.member_updated(self.user(entry['user']), joined)
+
+    async def replay(self, entries: Iterator[Dict[str, Any]], speed: float) -> int:
+        loop = asyncio.get_running_loop()
+        tasks = []
+        started_at = first_t = None
+        count = 0
+        for entry in entries:
+            client, update = self.update(entry)
+            count += 1
+            if not speed:
+                try:
+                    await self.harness.feed(update, client)
+                except Exception as e:
+                    print(f"Replayed update failed: {e!r}")
+                continue
+            if started_at is None:
+                started_at, first_t = loop.time(), entry['t']
+            if (delay := (entry['t'] - first_t) / speed - (loop.time() - started_at)) > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.harness.feed(update, client)))
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Replayed update failed: {result!r}")
+        return count
+
+
+async def main(args: argparse.Namespace):
+    harness = Harness(members=0, latency=args.latency / 1000, jitter=args.latency / 4000,
+                      rate_limits=args.rate_limits, cooldowns=args.cooldowns)
+    await harness.start()
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler:
+            profiler.enable()
+        count = await Replayer(harness).replay(read_capture(args.capture), args.speed)
+        if profiler:
+            profiler.disable()
+    finally:
+        await harness.stop()
+    print(f"Replayed {count} updates\n\n{metrics.report()}\n\n{harness.bot.loop_monitor.report()}")
+    if profiler:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('capture', help="файл записи (RECORD_UPDATES)")
+    parser.add_argument('--speed', type=float, default=0, help="ускорение записанного темпа; 0 — без пауз")
+    parser.add_argument('--latency', type=float, default=0, help="задержка фейкового API, мс")
+    parser.add_argument('--rate-limits', action='store_true', help="оставить ограничения очереди исходящих")
+    parser.add_argument('--cooldowns', action='store_true', help="оставить ограничения частоты команд")
+    parser.add_argument('--profile', help="записать профиль cProfile в файл")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,44 @@
+"""
+Выбор слова для крокодила на колоде из 100 000 слов: старый ``random.choice``
+по отфильтрованному списку против ``WordDeck``.
+
+    python -m benchmarks.word_picker
+"""
+import random
+import time
+
+from crocodile import WordDeck
+
+PACK_SIZE = 100_000
+OLD_PICKS = 200
+NEW_PICKS = PACK_SIZE
+
+
+def old_picker(words, picks: int):
+    recent_words = []
+    for _ in range(picks):
+        word = random.choice([word for word in words if word not in recent_words])
+        recent_words.append(word)
+
+
+def deck_picker(words, picks: int):
+    deck = WordDeck(words)
+    drawn = {deck.draw() for _ in range(picks)}
+    assert len(drawn) == picks
+
+
+def measure(func, words, picks: int) -> float:
+    start = time.perf_counter()
+    func(words, picks)
+    return (time.perf_counter() - start) / picks * 1e6
+
+
+def main():
+    words = [f"слово{i}" for i in range(PACK_SIZE)]
+    print(f"pack size: {PACK_SIZE}")
+    print(f"old picker:  {measure(old_picker, words, OLD_PICKS):>12.2f} µs/pick ({OLD_PICKS} picks)")
+    print(f"WordDeck:    {measure(deck_picker, words, NEW_PICKS):>12.2f} µs/pick ({NEW_PICKS} picks)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Optional, TypeVar, List
+
+T = TypeVar('T')
+
+
+class ChatRegistry(Generic[T]):
+    """
+    Состояние бота по чатам.
+
+    Состояние создается ``factory`` при первом обращении к чату. Чаты хранятся
+    в порядке последнего обращения, поэтому вытеснение простаивающих чатов
+    проходит только по самым старым записям. Чаты, для которых ``is_busy``
+    возвращает ``True`` (например, идет игра), не вытесняются.
+    """
+    IDLE_TTL = 6 * 60 * 60
+    MAX_CHATS = 1000
+
+    def __init__(
+            self,
+            factory: Callable[[int], T],
+            on_evict: Callable[[T], None] = None,
+            is_busy: Callable[[T], bool] = None
+    ):
+        self.factory = factory
+        self.on_evict = on_evict
+        self.is_busy = is_busy
+        self._states: 'OrderedDict[int, T]' = OrderedDict()
+        self._last_seen: Dict[int, float] = {}
+
+    def __len__(self):
+        return len(self._states)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._states
+
+    def get(self, chat_id: int) -> T:
+        if (state := self._states.get(chat_id)) is None:
+            state = self._states[chat_id] = self.factory(chat_id)
+            if len(self._states) > self.MAX_CHATS:
+                self._evict(lambda _: True, limit=len(self._states) - self.MAX_CHATS)
+        else:
+            self._states.move_to_end(chat_id)
+        self._last_seen[chat_id] = time.monotonic()
+        return state
+
+    def peek(self, chat_id: int) -> Optional[T]:
+        """Состояние чата без создания и без обновления времени обращения."""
+        return self._states.get(chat_id)
+
+    def values(self) -> List[T]:
+        return list(self._states.values())
+
+    def evict_idle(self) -> int:
+        deadline = time.monotonic() - self.IDLE_TTL
+        return self._evict(lambda chat_id: self._last_seen[chat_id] < deadline)
+
+    def _evict(self, should_evict: Callable[[int], bool], limit: int = None) -> int:
+        evicted = 0
+        for chat_id in list(self._states):
+            if limit is not None and evicted >= limit or not should_evict(chat_id):
+                break
+            state = self._states[chat_id]
+            if self.is_busy and self.is_busy(state):
+                continue
+            del self._states[chat_id]
+            del self._last_seen[chat_id]
+            if self.on_evict:
+                self.on_evict(state)
+            evicted += 1
+        return evicted
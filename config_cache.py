@@ -0,0 +1,122 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from peewee import SQL
+
+from db import Config, ChatConfig, run_db
+
+
+class ConfigKey:
+    ANTI_FISHING = 'anti_fishing'
+    ANTI_PIPISA_ADS = 'anti_pipisa_ads'
+    PIPISA_AD_TEXT_REPLACEMENT = 'pipisa_ad_text_replacement'
+
+
+CONFIG_TYPES: Dict[str, type] = {
+    ConfigKey.ANTI_FISHING: bool,
+    ConfigKey.ANTI_PIPISA_ADS: bool,
+    ConfigKey.PIPISA_AD_TEXT_REPLACEMENT: str,
+}
+CONFIG_DEFAULTS: Dict[str, Any] = {
+    ConfigKey.ANTI_FISHING: False,
+    ConfigKey.ANTI_PIPISA_ADS: False,
+    ConfigKey.PIPISA_AD_TEXT_REPLACEMENT: '',
+}
+TRUE_VALUES = ('true', '1', 'yes', 'on')
+
+ConfigListener = Callable[[Optional[int], str, Any], None]
+
+
+def parse_config_value(key: str, raw: str) -> Any:
+    if CONFIG_TYPES.get(key, str) is bool:
+        return raw.strip().lower() in TRUE_VALUES
+    return raw
+
+
+class ConfigCache:
+    """
+    Типизированный кэш ``Config`` (общие значения) и ``ChatConfig`` (значения чатов).
+
+    Загружается одним запросом, ``set`` сначала меняет кэш, затем пишет в базу.
+    Изменения, сделанные в базе напрямую, подхватываются ``poll``: тот же запрос
+    повторяется по расписанию и сравнивается с кэшем, а об отличиях сообщается
+    подписчикам ``on_change``. Ключи, запись которых еще не закончилась, ``poll`` не трогает.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.chat_values: Dict[int, Dict[str, Any]] = {}
+        self._listeners: List[ConfigListener] = []
+        self._generation = 0
+        self._writing: Dict[Tuple[Optional[int], str], int] = {}  # writes in flight per (chat_id, key)
+
+    @staticmethod
+    def _fetch() -> List[Tuple[Optional[int], str, str]]:
+        shared = Config.select(SQL('NULL').alias('chat_id'), Config.key, Config.value)
+        per_chat = ChatConfig.select(ChatConfig.chat_id, ChatConfig.key, ChatConfig.value)
+        return list((shared | per_chat).tuples())
+
+    @staticmethod
+    def _build(rows) -> Tuple[Dict[str, Any], Dict[int, Dict[str, Any]]]:
+        values: Dict[str, Any] = {}
+        chat_values: Dict[int, Dict[str, Any]] = {}
+        for chat_id, key, raw in rows:
+            target = values if chat_id is None else chat_values.setdefault(chat_id, {})
+            target[key] = parse_config_value(key, raw)
+        return values, chat_values
+
+    def load(self):
+        self.values, self.chat_values = self._build(self._fetch())
+
+    def get(self, key: str, chat_id: int = None) -> Any:
+        if chat_id is not None and key in (chat_values := self.chat_values.get(chat_id, {})):
+            return chat_values[key]
+        return self.values.get(key, CONFIG_DEFAULTS.get(key))
+
+    def on_change(self, listener: ConfigListener):
+        self._listeners.append(listener)
+
+    def _notify(self, chat_id: Optional[int], key: str, value: Any):
+        for listener in self._listeners:
+            listener(chat_id, key, value)
+
+    @staticmethod
+    def _write(chat_id: Optional[int], key: str, raw: str):
+        if chat_id is None:
+            (Config.insert(key=key, value=raw)
+             .on_conflict(conflict_target=[Config.key], update={Config.value: raw})
+             .execute())
+        else:
+            (ChatConfig.insert(chat_id=chat_id, key=key, value=raw)
+             .on_conflict(conflict_target=[ChatConfig.chat_id, ChatConfig.key], update={ChatConfig.value: raw})
+             .execute())
+
+    async def set(self, key: str, value: Any, chat_id: int = None):
+        self._generation += 1
+        self._writing[chat_id, key] = self._writing.get((chat_id, key), 0) + 1
+        target = self.values if chat_id is None else self.chat_values.setdefault(chat_id, {})
+        target[key] = value
+        self._notify(chat_id, key, value)
+        try:
+            await run_db(self._write, chat_id, key, str(value))
+        finally:
+            # a poll that fetched before the commit must not put the old value back
+            self._generation += 1
+            if (count := self._writing.pop((chat_id, key)) - 1) > 0:
+                self._writing[chat_id, key] = count
+
+    async def poll(self):
+        generation = self._generation
+        values, chat_values = self._build(await run_db(self._fetch))
+        if generation != self._generation:
+            return  # a local write raced with the fetch, the next poll will see it
+        for chat_id, key in self._writing:
+            target = values if chat_id is None else chat_values.setdefault(chat_id, {})
+            current = self.values if chat_id is None else self.chat_values.get(chat_id, {})
+            target[key] = current[key]
+        changes = [(None, key, value) for key, value in values.items() if self.values.get(key) != value]
+        for chat_id, chat_config in chat_values.items():
+            current = self.chat_values.get(chat_id, {})
+            changes.extend((chat_id, key, value) for key, value in chat_config.items() if current.get(key) != value)
+        self.values, self.chat_values = values, chat_values
+        for chat_id, key, value in changes:
+            self._notify(chat_id, key, value)
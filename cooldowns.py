@@ -0,0 +1,56 @@
+import time
+from typing import Dict, Tuple, NamedTuple, Optional, Set
+
+
+class CooldownRule(NamedTuple):
+    per_user: float = 0
+    per_chat: float = 0
+    notify: bool = True
+
+
+class Cooldowns:
+    """
+    Ограничение частоты команд по пользователю и по чату.
+
+    Хранится только время окончания активных задержек; истекшие записи
+    удаляются ``purge``. О превышении сообщается один раз за задержку
+    (если правило это разрешает), остальные повторы отбрасываются молча.
+    """
+
+    def __init__(self, rules: Dict[str, CooldownRule]):
+        self.rules = rules
+        self._until: Dict[Tuple[str, int, int], float] = {}
+        self._notified: Set[Tuple[str, int, int]] = set()
+
+    def hit(self, command: str, chat_id: int, user_id: int) -> Tuple[bool, Optional[float]]:
+        """
+        Учесть вызов команды.
+
+        :return: (разрешено ли, через сколько секунд можно снова — если нужно предупредить, иначе None)
+        """
+        if (rule := self.rules.get(command)) is None:
+            return True, None
+        now = time.monotonic()
+        user_key, chat_key = (command, chat_id, user_id), (command, chat_id, 0)
+        blocked_until = max(self._until.get(user_key, 0), self._until.get(chat_key, 0))
+        if blocked_until > now:
+            if not rule.notify or user_key in self._notified:
+                return False, None
+            self._notified.add(user_key)
+            return False, blocked_until - now
+        self._notified.discard(user_key)
+        if rule.per_user:
+            self._until[user_key] = now + rule.per_user
+        if rule.per_chat:
+            self._until[chat_key] = now + rule.per_chat
+        return True, None
+
+    def purge(self) -> int:
+        now = time.monotonic()
+        expired = [key for key, until in self._until.items() if until <= now]
+        for key in expired:
+            del self._until[key]
+        # a user blocked only by the chat cooldown has no entry of their own in _until
+        self._notified = {key for key in self._notified
+                          if key in self._until or (key[0], key[1], 0) in self._until}
+        return len(expired)
@@ -0,0 +1,176 @@
+import random
+import re
+from typing import Dict, Sequence, Optional, FrozenSet
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_STEM_ENDINGS_RE = re.compile(r"(?:ами|ями|ов|ев|ей|ом|ем|ой|ам|ям|ах|ях|ью|[аяоеьйыиую])$")
+INFLECTION_ENDINGS = (
+    '', 'а', 'я', 'у', 'ю', 'е', 'и', 'ы', 'о', 'ь', 'й',
+    'ом', 'ем', 'ой', 'ей', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях', 'ью', 'ами', 'ями',
+)
+MIN_INFLECTED_STEM = 3
+
+
+def normalize_guess(text: str) -> str:
+    return _NON_WORD_RE.sub('', text.lower().replace('ё', 'е'))
+
+
+class WordHistory:
+    """
+    Битовое множество индексов уже загаданных слов, которое хранится в базе между играми.
+
+    ``unsaved`` считает изменения с последнего сохранения, чтобы писать в базу пачками.
+    """
+    SAVE_EVERY = 10
+
+    def __init__(self, size: int, data: bytes = b''):
+        self.size = size
+        self.bits = bytearray((size + 7) // 8)
+        data = data[:len(self.bits)]
+        self.bits[:len(data)] = data
+        self.unsaved = 0
+
+    def __contains__(self, index: int) -> bool:
+        return bool(self.bits[index >> 3] >> (index & 7) & 1)
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def add(self, index: int):
+        self.bits[index >> 3] |= 1 << (index & 7)
+        self.unsaved += 1
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.unsaved += 1
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
+
+
+class WordDeck:
+    """
+    Колода слов без повторов: каждое слово выпадает один раз, пока колода не закончится.
+
+    Перемешивание ленивое (Фишер — Йетс по требованию), поэтому и создание колоды,
+    и вытягивание слова стоят O(1), а в памяти хранятся только переставленные позиции.
+    Слова из ``history`` пропускаются; когда колода заканчивается, история очищается.
+    """
+
+    def __init__(self, words: Sequence[str], history: Optional[WordHistory] = None):
+        self.words = words
+        self.history = history
+        self.position = 0
+        self._swapped: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def remaining(self) -> int:
+        return len(self.words) - self.position
+
+    def reshuffle(self):
+        self.position = 0
+        self._swapped.clear()
+
+    def draw_index(self) -> int:
+        while True:
+            index = self._draw_raw_index()
+            if self.history is None:
+                return index
+            if index not in self.history:
+                self.history.add(index)
+                return index
+
+    def _draw_raw_index(self) -> int:
+        if self.position >= len(self.words):
+            self.reshuffle()
+            if self.history is not None:
+                self.history.clear()
+        position = self.position
+        chosen = random.randrange(position, len(self.words))
+        head = self._swapped.pop(position, position)
+        if chosen == position:
+            index = head
+        else:
+            index = self._swapped.get(chosen, chosen)
+            self._swapped[chosen] = head
+        self.position += 1
+        return index
+
+    def draw(self) -> str:
+        return self.words[self.draw_index()]
+
+
+class GuessMatcher:
+    """
+    Проверка отгадки для одного слова.
+
+    Все допустимые формы (регистр, ё/е, пунктуация, простые окончания) считаются
+    один раз при выборе слова, проверка сообщения — одна нормализация и поиск в множестве.
+    """
+
+    def __init__(self, word: str):
+        self.word = word
+        self.normalized = normalize_guess(word)
+        self.forms: FrozenSet[str] = self._inflect(self.normalized)
+
+    @staticmethod
+    def _inflect(normalized: str) -> FrozenSet[str]:
+        stem = _STEM_ENDINGS_RE.sub('', normalized)
+        if len(stem) < MIN_INFLECTED_STEM:
+            return frozenset([normalized])
+        return frozenset([normalized, *(stem + ending for ending in INFLECTION_ENDINGS)])
+
+    def matches(self, text: str) -> bool:
+        return normalize_guess(text) in self.forms
+
+
+def within_edit_distance(a: str, b: str, max_distance: int) -> bool:
+    """Расстояние Левенштейна не больше ``max_distance``: DP только по полосе шириной 2k+1 с ранним выходом."""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= max_distance else too_far
+        row_min = current[0]
+        char = a[i - 1]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_distance:
+            return False
+        previous = current
+    return previous[len(b)] <= max_distance
+
+
+class FuzzyGuessMatcher(GuessMatcher):
+    """
+    Отгадка с опечатками: допускает 1 правку для слов от 5 букв и 2 правки для слов от 8 букв.
+
+    Сообщения, длина которых отличается от слова больше чем на допустимое число правок,
+    отсекаются без DP.
+    """
+    DISTANCES = ((8, 2), (5, 1))
+
+    def __init__(self, word: str):
+        super().__init__(word)
+        self.max_distance = next((distance for length, distance in self.DISTANCES if len(self.normalized) >= length), 0)
+
+    def matches(self, text: str) -> bool:
+        normalized = normalize_guess(text)
+        if normalized in self.forms:
+            return True
+        return self.max_distance > 0 and within_edit_distance(normalized, self.normalized, self.max_distance)
@@ -534,6 +534,4 @@ class Words:
         "безрассудство",
     ]
 
-    @property
-    def ALL(self):
-        return self.EASY + self.MEDIUM + self.HARD
+    ALL: List[str] = EASY + MEDIUM + HARD
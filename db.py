@@ -1,9 +1,81 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import getenv
+from typing import Callable, TypeVar, Optional, Iterable
 
-from peewee import Model, TextField, PrimaryKeyField, ForeignKeyField, BooleanField
+from peewee import Model, TextField, PrimaryKeyField, ForeignKeyField, BooleanField, BigIntegerField, BlobField, CompositeKey
 from playhouse.db_url import connect
 
-db = connect(getenv('DATABASE_URL'))
+T = TypeVar('T')
+
+DB_POOL_SIZE = int(getenv('DB_POOL_SIZE', 4))
+POOLED_SCHEMES = ('postgres', 'postgresql', 'mysql')
+BLOCKING_QUERY_WARN_THRESHOLD = 0.05
+
+
+def _connect(url: str):
+    scheme, separator, rest = url.partition('://')
+    if scheme in POOLED_SCHEMES:
+        return connect(f"{scheme}+pool://{rest}", max_connections=DB_POOL_SIZE, stale_timeout=300)
+    return connect(url)
+
+
+db = _connect(getenv('DATABASE_URL'))
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix='db')
+
+
+def _in_connection(func: Callable[..., T], *args, **kwargs) -> T:
+    with db.connection_context():
+        return func(*args, **kwargs)
+
+
+async def run_db(func: Callable[..., T], *args, **kwargs) -> T:
+    """Выполнить синхронный код с запросами peewee в пуле потоков, не блокируя цикл событий."""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, partial(_in_connection, func, *args, **kwargs))
+
+
+class InlineQueryStats:
+    """Запросы, выполненные прямо в потоке цикла событий, и сколько они его блокировали."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slowest_sql: Optional[str] = None
+
+    def add(self, duration: float, sql: str):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+            self.slowest_sql = sql
+        if duration > BLOCKING_QUERY_WARN_THRESHOLD:
+            print(f"DB query blocked the event loop for {duration * 1000:.0f} ms: {sql[:200]}")
+
+    def report(self) -> str:
+        return (f"Запросы к базе в цикле событий: {self.count}, всего {self.total * 1000:.0f} мс, "
+                f"макс. {self.max * 1000:.0f} мс" + (f" ({self.slowest_sql[:100]})" if self.slowest_sql else ''))
+
+
+inline_query_stats = InlineQueryStats()
+_execute_sql = db.execute_sql
+
+
+def _timed_execute_sql(sql, params=None, *args, **kwargs):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return _execute_sql(sql, params, *args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return _execute_sql(sql, params, *args, **kwargs)
+    finally:
+        inline_query_stats.add(time.perf_counter() - start, sql)
+
+
+db.execute_sql = _timed_execute_sql
 
 
 class BaseModel(Model):
@@ -22,7 +94,7 @@ class User(BaseModel):
 
 class MentionGroup(BaseModel):
     id = PrimaryKeyField()
-    name = TextField(null=False)
+    name = TextField(null=False, unique=True)
 
     class Meta:
         table_name = "mention_group"
@@ -35,6 +107,17 @@ class GroupAffiliation(BaseModel):
 
     class Meta:
         table_name = "group_affiliation"
+        indexes = (
+            (('mention_group_id', 'user_id'), True),
+        )
+
+
+def save_users(users: Iterable):
+    """Добавить пользователей Telegram в ``User``, если их там еще нет."""
+    rows = [{'user_id': user.id, 'username': user.username or str(user.id),
+             'first_name': user.first_name or '', 'last_name': user.last_name or ''} for user in users]
+    if rows:
+        User.insert_many(rows).on_conflict_ignore().execute()
 
 
 class RestrictedUser(BaseModel):
@@ -45,6 +128,63 @@ class RestrictedUser(BaseModel):
         table_name = "restricted_user"
 
 
+class BotAdmin(BaseModel):
+    chat_id = BigIntegerField()
+    user_id = ForeignKeyField(User, 'user_id')
+
+    class Meta:
+        table_name = "bot_admin"
+        primary_key = CompositeKey('chat_id', 'user_id')
+
+
 class Config(BaseModel):
     key = PrimaryKeyField()
     value = TextField(null=False)
+
+
+class ChatConfig(BaseModel):
+    chat_id = BigIntegerField()
+    key = TextField()
+    value = TextField(null=False)
+
+    class Meta:
+        table_name = "chat_config"
+        primary_key = CompositeKey('chat_id', 'key')
+
+
+class CrocodileWordHistory(BaseModel):
+    chat_id = BigIntegerField(primary_key=True)
+    used_words = BlobField(null=False)  # bitset of Words.ALL indices
+
+    class Meta:
+        table_name = "crocodile_word_history"
+
+
+class Trigger(BaseModel):
+    id = PrimaryKeyField()
+    name = TextField(null=False, unique=True)
+
+
+class TriggerPhrase(BaseModel):
+    trigger_id = ForeignKeyField(Trigger, 'id', on_delete='CASCADE')
+    phrase = TextField(null=False)
+
+    class Meta:
+        table_name = "trigger_phrase"
+
+
+class TriggerResponse(BaseModel):
+    trigger_id = ForeignKeyField(Trigger, 'id', on_delete='CASCADE')
+    text = TextField(null=False)  # duplicates are allowed and make the response more likely
+
+    class Meta:
+        table_name = "trigger_response"
+
+
+# tables added after the original schema; the original ones are managed outside the bot
+NEW_TABLES = [CrocodileWordHistory, ChatConfig, BotAdmin, Trigger, TriggerPhrase, TriggerResponse]
+
+
+def create_schema():
+    """Создать недостающие таблицы из ``NEW_TABLES``; существующие не трогаются."""
+    db.create_tables(NEW_TABLES, safe=True)
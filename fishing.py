@@ -0,0 +1,54 @@
+import re
+from typing import List, NamedTuple, Optional
+
+from moderation import ModerationQueue
+from scheduler import Job
+
+FISHING_BOT_ID = 200164142
+FISHING_MESSAGE_RE = re.compile(r"^🎣 \[Рыбалка\] 🎣")
+YOU_RECEIVE_RE = re.compile(r"Вы получаете (.+)")
+ENERGY_LEFT_RE = re.compile(r"Энергии осталось: (.+)")
+ZERO_ENERGY_RE = re.compile(r"0(?!\d)")
+
+
+class FishingCast(NamedTuple):
+    catch: Optional[str]
+    energy: Optional[str]
+
+    @property
+    def out_of_energy(self) -> bool:
+        return self.energy is None or ZERO_ENERGY_RE.match(self.energy) is not None
+
+
+def parse_fishing(text: str) -> FishingCast:
+    catch = match[1] if (match := YOU_RECEIVE_RE.search(text)) else None
+    energy = match[1] if (match := ENERGY_LEFT_RE.search(text)) else None
+    return FishingCast(catch, energy)
+
+
+class FishingSession:
+    """
+    Подряд идущие сообщения рыбалки одного рыбака в чате.
+
+    Сессия копится, пока у рыбака не кончится энергия (или пока он не перестанет рыбачить),
+    после чего бот отправляет одну сводку и удаляет все сообщения одним запросом.
+    """
+    MAX_MESSAGES = ModerationQueue.MAX_BATCH  # the whole session goes out in one delete_messages
+
+    def __init__(self):
+        self.message_ids: List[int] = []
+        self.casts: List[FishingCast] = []
+        self.timer: Optional[Job] = None
+
+    def add(self, message_id: int, cast: FishingCast):
+        self.message_ids.append(message_id)
+        self.casts.append(cast)
+
+    @property
+    def finished(self) -> bool:
+        return self.casts[-1].out_of_energy or len(self.message_ids) >= self.MAX_MESSAGES
+
+    def summary(self) -> str:
+        catches = [cast.catch for cast in self.casts if cast.catch] or ["ничего"]
+        energy = self.casts[-1].energy
+        return '\n'.join(catches) + '\n' + (energy if energy is not None else "нет энергии")
@@ -0,0 +1,89 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, NamedTuple, Optional
+
+from metrics import active_handler
+from scheduler import LatenessStats
+
+
+class BlockingEvent(NamedTuple):
+    at: float
+    stalled: float
+    handler: Optional[str]
+    stack: str
+
+
+class LoopMonitor:
+    """
+    Сторож цикла событий, общего для бота и селфбота.
+
+    Корутина на цикле отмечается каждые ``INTERVAL`` секунд и меряет, насколько
+    позже она просыпается (задержка цикла). Отдельный поток следит за отметками:
+    если цикл не отвечает дольше ``THRESHOLD``, он снимает стек потока цикла —
+    то есть место, где цикл заблокирован, — и имя выполняемого обработчика.
+    """
+    INTERVAL = 0.1
+    THRESHOLD = 0.25
+    STACK_LIMIT = 15
+    EVENTS_WINDOW = 50
+
+    def __init__(self):
+        self.lag = LatenessStats()
+        self.events: Deque[BlockingEvent] = deque(maxlen=self.EVENTS_WINDOW)
+        self.blocked = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._capturing = False
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.INTERVAL
+            await asyncio.sleep(self.INTERVAL)
+            lag = max(0.0, loop.time() - expected)
+            self._heartbeat = time.monotonic()
+            self.lag.add(lag)
+            if self._capturing:
+                self._capturing = False
+                event = self.events[-1]
+                print(f"Event loop blocked for {lag * 1000:.0f} ms in {event.handler or 'unknown handler'}:\n{event.stack}")
+
+    def _watch(self):
+        while not self._stopped.wait(self.INTERVAL):
+            stalled = time.monotonic() - self._heartbeat - self.INTERVAL
+            if self._capturing or stalled < self.THRESHOLD:
+                continue
+            if (frame := sys._current_frames().get(self._loop_thread_id)) is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame, limit=self.STACK_LIMIT))
+            self.events.append(BlockingEvent(time.time(), stalled, active_handler(frame), stack))
+            self.blocked += 1
+            self._capturing = True
+
+    def report(self, limit: int = 3) -> str:
+        lines = [f"Задержка цикла: p50 {self.lag.percentile(0.5) * 1000:.0f} мс, p99 {self.lag.percentile(0.99) * 1000:.0f} мс, "
+                 f"макс. {self.lag.max * 1000:.0f} мс, блокировок > {self.THRESHOLD * 1000:.0f} мс: {self.blocked}"]
+        for event in list(self.events)[-limit:]:
+            tail = event.stack.strip().splitlines()[-2:] if event.stack else []
+            lines.append(f"• {time.strftime('%H:%M:%S', time.localtime(event.at))} {event.handler or '?'}: "
+                         + ' '.join(line.strip() for line in tail))
+        return '\n'.join(lines)
@@ -0,0 +1,155 @@
+import asyncio
+from typing import Dict, Set, Optional, List, Tuple
+
+from peewee import JOIN, Value
+
+from db import db, MentionGroup, GroupAffiliation, run_db, save_users
+
+
+DORM_GROUP = "общажники"
+GROUP_ALIASES: Dict[str, str] = {"общага": DORM_GROUP}
+
+
+def normalize_group_name(name: str) -> str:
+    name = name.lstrip('@').lower()
+    return GROUP_ALIASES.get(name, name)
+
+
+class MentionGroupIndex:
+    """
+    Группы упоминания из ``MentionGroup``/``GroupAffiliation``, загруженные одним запросом.
+
+    Все изменения групп должны проходить через методы индекса: они пишут в базу
+    и сразу обновляют индекс, поэтому разрешение ``@группа`` не ходит в базу.
+    Запросы выполняются в пуле ``run_db``, а индекс меняется только в цикле событий;
+    перезагрузка и изменения идут по очереди под ``_lock``, чтобы перезагрузка не
+    затерла изменение, записанное, пока она читала базу.
+    Синонимы из ``GROUP_ALIASES`` ведут на ту же группу (``@общага`` — это ``@общажники``).
+
+    Раньше ``@общажники`` отмечал всех, у кого есть хоть одна ``GroupAffiliation``; если
+    при первой загрузке такой группы нет, она создается из этих участников.
+    """
+
+    def __init__(self):
+        self.group_ids: Dict[str, int] = {}
+        self.members_by_group: Dict[int, Set[int]] = {}
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _migrate_dorm_group():
+        if not GroupAffiliation.select().exists() or MentionGroup.select().where(MentionGroup.name == DORM_GROUP).exists():
+            return
+        with db.atomic():
+            group = MentionGroup.create(name=DORM_GROUP)
+            affiliated = GroupAffiliation.select(Value(group.id), GroupAffiliation.user_id).distinct()
+            GroupAffiliation.insert_from(affiliated, [GroupAffiliation.mention_group_id, GroupAffiliation.user_id]).execute()
+
+    @classmethod
+    def _fetch(cls, migrate: bool) -> List[Tuple[int, str, Optional[int]]]:
+        if migrate:
+            cls._migrate_dorm_group()
+        return list(MentionGroup
+                    .select(MentionGroup.id, MentionGroup.name, GroupAffiliation.user_id)
+                    .join(GroupAffiliation, JOIN.LEFT_OUTER, on=(GroupAffiliation.mention_group_id == MentionGroup.id))
+                    .tuples())
+
+    def _apply(self, rows: List[Tuple[int, str, Optional[int]]]):
+        group_ids: Dict[str, int] = {}
+        members_by_group: Dict[int, Set[int]] = {}
+        for group_id, name, user_id in rows:
+            group_ids[normalize_group_name(name)] = group_id
+            members = members_by_group.setdefault(group_id, set())
+            if user_id is not None:
+                members.add(user_id)
+        self.group_ids = group_ids
+        self.members_by_group = members_by_group
+        self.loaded = True
+
+    def load(self):
+        """Загрузить индекс синхронно — при старте, пока к нему никто не обращается."""
+        self._apply(self._fetch(not self.loaded))
+
+    async def reload(self):
+        async with self._lock:
+            self._apply(await run_db(self._fetch, not self.loaded))
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def names(self) -> List[str]:
+        self._ensure_loaded()
+        return sorted(self.group_ids)
+
+    def members(self, name: str) -> Optional[Set[int]]:
+        """ID участников группы или ``None``, если такой группы нет."""
+        self._ensure_loaded()
+        if (group_id := self.group_ids.get(normalize_group_name(name))) is None:
+            return None
+        return self.members_by_group[group_id]
+
+    async def create_group(self, name: str) -> bool:
+        name = normalize_group_name(name)
+        async with self._lock:
+            if self.members(name) is not None:
+                return False
+            group = await run_db(MentionGroup.create, name=name)
+            self.group_ids[name] = group.id
+            self.members_by_group[group.id] = set()
+            return True
+
+    @staticmethod
+    def _delete_group(group_id: int):
+        with db.atomic():
+            GroupAffiliation.delete().where(GroupAffiliation.mention_group_id == group_id).execute()
+            MentionGroup.delete().where(MentionGroup.id == group_id).execute()
+
+    async def delete_group(self, name: str) -> bool:
+        name = normalize_group_name(name)
+        async with self._lock:
+            if self.members(name) is None:
+                return False
+            group_id = self.group_ids[name]
+            await run_db(self._delete_group, group_id)
+            del self.group_ids[name]
+            del self.members_by_group[group_id]
+            return True
+
+    @staticmethod
+    def _insert_members(group_id: int, users: list):
+        with db.atomic():
+            save_users(users)
+            GroupAffiliation.insert_many([
+                {'mention_group_id': group_id, 'user_id': user.id} for user in users
+            ]).on_conflict_ignore().execute()
+
+    async def add_members(self, name: str, users: list) -> Optional[int]:
+        """Добавить пользователей в группу. Возвращает число добавленных или ``None``, если группы нет."""
+        async with self._lock:
+            if (members := self.members(name)) is None:
+                return None
+            group_id = self.group_ids[normalize_group_name(name)]
+            new_users = [user for user in users if user.id not in members]
+            if new_users:
+                await run_db(self._insert_members, group_id, new_users)
+                members.update(user.id for user in new_users)
+            return len(new_users)
+
+    @staticmethod
+    def _delete_members(group_id: int, user_ids: List[int]):
+        (GroupAffiliation.delete()
+         .where((GroupAffiliation.mention_group_id == group_id) & (GroupAffiliation.user_id.in_(user_ids)))
+         .execute())
+
+    async def remove_members(self, name: str, user_ids: List[int]) -> Optional[int]:
+        """Убрать пользователей из группы. Возвращает число убранных или ``None``, если группы нет."""
+        async with self._lock:
+            if (members := self.members(name)) is None:
+                return None
+            group_id = self.group_ids[normalize_group_name(name)]
+            to_remove = [user_id for user_id in user_ids if user_id in members]
+            if to_remove:
+                await run_db(self._delete_members, group_id, to_remove)
+                members.difference_update(to_remove)
+            return len(to_remove)
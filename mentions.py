@@ -0,0 +1,58 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+from pyrogram import types
+
+TEXT_LIMIT = 4096
+ENTITY_LIMIT = 100
+SEPARATOR = ' '
+
+
+def text_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram — в кодовых единицах UTF-16."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+class RenderedMention(NamedTuple):
+    text: str
+    length: int  # длина видимого текста после разбора разметки
+
+
+class MentionCache:
+    """Отрисованные ``user.mention`` по ID пользователя; пересчитываются, только если изменилось имя."""
+
+    def __init__(self):
+        self._cache: Dict[int, Tuple[str, RenderedMention]] = {}
+
+    def render(self, user: types.User) -> RenderedMention:
+        name = user.first_name or "Deleted Account"
+        cached = self._cache.get(user.id)
+        if cached is None or cached[0] != name:
+            cached = self._cache[user.id] = (name, RenderedMention(str(user.mention), text_length(name)))
+        return cached[1]
+
+
+def pack_mentions(mentions: List[RenderedMention], header: RenderedMention, header_entities: int = 0) -> List[str]:
+    """
+    Жадно разложить упоминания по минимальному числу сообщений.
+
+    Каждое сообщение укладывается в ``TEXT_LIMIT`` видимых символов и ``ENTITY_LIMIT``
+    сущностей; первое начинается с ``header`` (или состоит только из него, если
+    рядом с ним не помещается ни одно упоминание).
+    """
+    messages: List[str] = []
+    parts: List[str] = []
+    prefix = header.text + '\n'
+    length, entities = header.length + 1, header_entities
+    for mention in mentions:
+        extra = mention.length + (len(SEPARATOR) if parts else 0)
+        if (parts or prefix) and (length + extra > TEXT_LIMIT or entities + 1 > ENTITY_LIMIT):
+            # a header too long to share a message with even one mention is sent on its own
+            messages.append(prefix + SEPARATOR.join(parts) if parts else header.text)
+            prefix, parts, length, entities = '', [], 0, 0
+            extra = mention.length
+        parts.append(mention.text)
+        length += extra
+        entities += 1
+    if parts:
+        messages.append(prefix + SEPARATOR.join(parts))
+    return messages
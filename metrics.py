@@ -0,0 +1,137 @@
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from types import FrameType
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+F = TypeVar('F', bound=Callable[..., Awaitable])
+
+METRICS_PREFIX = 'shmafiabot'
+
+
+class LatencyHistogram:
+    """Гистограмма длительностей с фиксированными корзинами: память не растет с числом наблюдений."""
+    BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float, error: bool = False):
+        index = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+        self.counts[index] += 1
+        self.count += 1
+        self.errors += error
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.BUCKETS[index - 1] if index else 0.0
+                upper = self.BUCKETS[index] if index < len(self.BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """
+    Задержки обработчиков бота и запросов к Telegram API.
+
+    Обработчики оборачиваются ``handler``, запросы к API — ``api_call``. Данные доступны
+    текстом для ``/perf`` (``report``) и в формате Prometheus (``render_prometheus``,
+    ``write_textfile`` — для textfile collector node_exporter).
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.families: Dict[str, Dict[str, LatencyHistogram]] = {'handler': {}, 'api': {}}
+
+    def observe(self, family: str, name: str, seconds: float, error: bool = False):
+        if (histogram := self.families[family].get(name)) is None:
+            histogram = self.families[family][name] = LatencyHistogram()
+        histogram.observe(seconds, error)
+
+    def handler(self, func: F) -> F:
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                self.observe('handler', name, time.perf_counter() - start, error)
+        return wrapper
+
+    @asynccontextmanager
+    async def api_call(self, method: str):
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe('api', method, time.perf_counter() - start, error)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for family, label in (('handler', 'handler'), ('api', 'method')):
+            metric = f"{METRICS_PREFIX}_{family}_seconds"
+            lines += [f"# HELP {metric} Latency of bot {family} calls", f"# TYPE {metric} histogram"]
+            for name, histogram in sorted(self.families[family].items()):
+                cumulative = 0
+                for bound, count in zip((*histogram.BUCKETS, '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+            errors = f"{METRICS_PREFIX}_{family}_errors_total"
+            lines += [f"# HELP {errors} Failed bot {family} calls", f"# TYPE {errors} counter"]
+            lines += [f'{errors}{{{label}="{name}"}} {histogram.errors}' for name, histogram in sorted(self.families[family].items())]
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as file:
+            file.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+    def report(self, limit: int = 10) -> str:
+        minutes = max((time.monotonic() - self.started_at) / 60, 1 / 60)
+        sections = []
+        for family, title in (('handler', "Обработчики"), ('api', "Telegram API")):
+            ranked = sorted(self.families[family].items(), key=lambda item: item[1].sum, reverse=True)[:limit]
+            rows = [f"{name}: {h.count} ({h.count / minutes:.1f}/мин), p50 {h.quantile(0.5) * 1000:.0f} мс, "
+                    f"p99 {h.quantile(0.99) * 1000:.0f} мс, макс. {h.max * 1000:.0f} мс"
+                    + (f", ошибок {h.errors}" if h.errors else '') for name, h in ranked]
+            sections.append(f"{title} (по суммарному времени):\n" + ('\n'.join(rows) or "нет данных"))
+        return '\n\n'.join(sections)
+
+
+metrics = Metrics()
+
+
+def active_handler(frame: Optional[FrameType]) -> Optional[str]:
+    """Имя ближайшего обработчика, обернутого ``Metrics.handler``, в стеке вызовов ``frame``."""
+    while frame is not None:
+        if frame.f_code.co_name == 'wrapper' and frame.f_code.co_filename == __file__:
+            return frame.f_locals.get('name')
+        frame = frame.f_back
+    return None
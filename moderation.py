@@ -0,0 +1,71 @@
+import asyncio
+from typing import Dict, Iterable, List, Tuple
+
+import pyrogram
+
+from outbox import Outbox
+from scheduler import Job, Scheduler
+
+
+class _PendingChat:
+    def __init__(self, client: pyrogram.Client, chat_id: int):
+        self.client = client
+        self.chat_id = chat_id
+        self.message_ids: List[int] = []
+        self.replacements: Dict[str, None] = {}  # ordered set of replacement texts
+        self.timer: Job = None
+
+
+class ModerationQueue:
+    """
+    Отложенное пакетное удаление сообщений (реклама, рыбалка).
+
+    Удаления в чате копятся ``WINDOW`` секунд с первого запроса, затем уходят одним
+    ``delete_messages`` (по ``MAX_BATCH`` ID за запрос), а сообщения-замены с одинаковым
+    текстом отправляются один раз. Клиент, который удаляет и пишет замену, передается явно.
+    """
+    WINDOW = 1.0
+    MAX_BATCH = 100  # delete_messages accepts at most 100 ids
+
+    def __init__(self, outbox: Outbox, scheduler: Scheduler):
+        self.outbox = outbox
+        self.scheduler = scheduler
+        self._pending: Dict[Tuple[str, int], _PendingChat] = {}
+        self.requested = 0
+        self.batches = 0
+        self.merged_replacements = 0
+
+    def delete(self, client: pyrogram.Client, chat_id: int, message_ids: Iterable[int], replacement: str = None):
+        key = (client.name, chat_id)
+        if (pending := self._pending.get(key)) is None:
+            pending = self._pending[key] = _PendingChat(client, chat_id)
+            pending.timer = self.scheduler.call_later(self.WINDOW, lambda: self.flush(key), name="moderation_flush")
+        message_ids = list(message_ids)
+        pending.message_ids.extend(message_ids)
+        self.requested += len(message_ids)
+        if replacement:
+            if replacement in pending.replacements:
+                self.merged_replacements += 1
+            pending.replacements[replacement] = None
+        if len(pending.message_ids) >= self.MAX_BATCH:
+            # flush right away, still through the scheduler, which keeps the task and logs its errors
+            pending.timer.cancel()
+            pending.timer = self.scheduler.call_later(0, lambda: self.flush(key), name="moderation_flush")
+
+    async def flush(self, key: Tuple[str, int]):
+        if (pending := self._pending.pop(key, None)) is None:
+            return
+        pending.timer.cancel()
+        batches = [pending.message_ids[i:i + self.MAX_BATCH] for i in range(0, len(pending.message_ids), self.MAX_BATCH)]
+        self.batches += len(batches)
+        await asyncio.gather(
+            *[self.outbox.delete_messages(pending.client, pending.chat_id, batch) for batch in batches],
+            *[self.outbox.send_message(pending.client, pending.chat_id, text) for text in pending.replacements],
+        )
+
+    async def flush_all(self):
+        await asyncio.gather(*(self.flush(key) for key in list(self._pending)))
+
+    def report(self) -> str:
+        return (f"удалений запрошено: {self.requested}, запросов delete_messages: {self.batches}, "
+                f"повторных замен объединено: {self.merged_replacements}, чатов в ожидании: {len(self._pending)}")
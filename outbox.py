@@ -0,0 +1,164 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+import pyrogram
+from pyrogram import types
+from pyrogram.errors import FloodWait
+
+from metrics import metrics
+
+T = TypeVar('T')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated: Optional[float] = None
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _ChatQueue:
+    def __init__(self, bucket: TokenBucket):
+        self.items: Deque[Tuple[Callable[[], Awaitable], str, asyncio.Future, float]] = deque()
+        self.bucket = bucket
+        self.worker: Optional[asyncio.Task] = None
+
+
+class Outbox:
+    """
+    Очередь исходящих запросов к Telegram (отправка, удаление) для всех клиентов бота.
+
+    У каждого чата своя очередь: запросы выполняются строго по порядку, не чаще
+    ограничения чата (``PER_CHAT_RATE``) и общего ограничения клиента (``GLOBAL_RATE``).
+    ``FloodWait`` не пробрасывается: клиент ставится на паузу на указанное время,
+    и запрос повторяется. Ведро ограничения чата переживает его очередь и удаляется,
+    только когда снова наполнилось, иначе каждая новая очередь получала бы полный запас.
+    """
+    PER_CHAT_RATE = 20 / 60
+    PER_CHAT_BURST = 5
+    GLOBAL_RATE = 25
+    GLOBAL_BURST = 25
+    MAX_FLOOD_WAIT_RETRIES = 5
+    WAIT_TIMES_WINDOW = 1000
+
+    def __init__(self):
+        self._queues: Dict[Tuple[str, int], _ChatQueue] = {}
+        self._chat_buckets: Dict[Tuple[str, int], TokenBucket] = {}
+        self._global_buckets: Dict[str, TokenBucket] = {}
+        self._paused_until: Dict[str, float] = {}
+        self.wait_times: Deque[float] = deque(maxlen=self.WAIT_TIMES_WINDOW)
+        self.completed = 0
+        self.failed = 0
+        self.flood_waits = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue.items) for queue in self._queues.values())
+
+    def submit(self, client: pyrogram.Client, chat_id: int, call: Callable[[], Awaitable[T]], method: str = 'request') -> 'asyncio.Future[T]':
+        loop = asyncio.get_running_loop()
+        key = (client.name, chat_id)
+        if (queue := self._queues.get(key)) is None:
+            if (bucket := self._chat_buckets.get(key)) is None:
+                bucket = self._chat_buckets[key] = TokenBucket(self.PER_CHAT_RATE, self.PER_CHAT_BURST)
+            queue = self._queues[key] = _ChatQueue(bucket)
+        future = loop.create_future()
+        queue.items.append((call, method, future, loop.time()))
+        self.max_depth = max(self.max_depth, len(queue.items))
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._drain(client.name, key, queue))
+        return future
+
+    def send_message(self, client: pyrogram.Client, chat_id: int, text: str, **kwargs) -> 'asyncio.Future[types.Message]':
+        return self.submit(client, chat_id, lambda: client.send_message(chat_id, text, **kwargs), 'send_message')
+
+    def reply(self, client: pyrogram.Client, message: types.Message, text: str, quote: bool = True, **kwargs) -> 'asyncio.Future[types.Message]':
+        if quote:
+            kwargs.setdefault('reply_to_message_id', message.id)
+        return self.send_message(client, message.chat.id, text, **kwargs)
+
+    def delete_messages(self, client: pyrogram.Client, chat_id: int, message_ids: List[int]) -> 'asyncio.Future[int]':
+        return self.submit(client, chat_id, lambda: client.delete_messages(chat_id, message_ids), 'delete_messages')
+
+    async def _wait_for_slot(self, client_name: str, bucket: TokenBucket):
+        loop = asyncio.get_running_loop()
+        global_bucket = self._global_buckets.setdefault(client_name, TokenBucket(self.GLOBAL_RATE, self.GLOBAL_BURST))
+        while True:
+            now = loop.time()
+            delay = max(self._paused_until.get(client_name, 0) - now, bucket.wait_time(now), global_bucket.wait_time(now))
+            if delay <= 0:
+                bucket.take(now)
+                global_bucket.take(now)
+                return
+            await asyncio.sleep(delay)
+
+    async def _drain(self, client_name: str, key: Tuple[str, int], queue: _ChatQueue):
+        loop = asyncio.get_running_loop()
+        retries = 0
+        while queue.items:
+            call, method, future, enqueued_at = queue.items[0]
+            if future.cancelled():
+                queue.items.popleft()
+                continue
+            await self._wait_for_slot(client_name, queue.bucket)
+            started_at = loop.time()
+            try:
+                async with metrics.api_call(method):
+                    result = await call()
+            except FloodWait as e:
+                self.flood_waits += 1
+                if retries < self.MAX_FLOOD_WAIT_RETRIES:
+                    retries += 1
+                    self._paused_until[client_name] = max(self._paused_until.get(client_name, 0), loop.time() + e.value)
+                    continue
+                queue.items.popleft()
+                self.failed += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            except Exception as e:
+                queue.items.popleft()
+                self.failed += 1
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                queue.items.popleft()
+                self.completed += 1
+                self.wait_times.append(started_at - enqueued_at)
+                if not future.cancelled():
+                    future.set_result(result)
+            retries = 0
+        if self._queues.get(key) is queue:
+            del self._queues[key]
+        self._drop_refilled_buckets(loop.time())
+
+    def _drop_refilled_buckets(self, now: float):
+        for key in [key for key, bucket in self._chat_buckets.items() if key not in self._queues and bucket.is_full(now)]:
+            del self._chat_buckets[key]
+
+    def report(self) -> str:
+        waits = sorted(self.wait_times)
+        p50 = waits[len(waits) // 2] if waits else 0.0
+        p99 = waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else 0.0
+        return (f"в очереди: {self.depth} (макс. {self.max_depth} в одном чате), чатов: {len(self._queues)}\n"
+                f"выполнено: {self.completed}, ошибок: {self.failed}, FloodWait: {self.flood_waits}\n"
+                f"ожидание p50 {p50 * 1000:.0f} мс, p99 {p99 * 1000:.0f} мс")
@@ -0,0 +1,65 @@
+from typing import Dict, Set, List
+
+from db import db, RestrictedUser, BotAdmin, save_users
+
+BOOTSTRAP_ADMIN_IDS: List[int] = [356786682, 633834276, 209007669, 55539711]  # яся, Марьям, дед
+
+
+class PermissionIndex:
+    """
+    Ограниченные пользователи и администраторы бота в памяти.
+
+    Загружается при старте, все изменения проходят через методы индекса
+    (запись в базу и обновление множеств), поэтому проверки прав — поиск в множестве.
+    Администраторы назначаются в каждом чате отдельно; администраторы из ``BOOTSTRAP_ADMIN_IDS``
+    есть во всех чатах всегда и не могут быть сняты.
+    """
+
+    def __init__(self):
+        self.restricted: Set[int] = set()
+        self.admins: Dict[int, Set[int]] = {}  # chat id -> admin ids
+
+    def load(self):
+        self.restricted = {user_id for user_id, in RestrictedUser.select(RestrictedUser.user_id).tuples()}
+        admins: Dict[int, Set[int]] = {}
+        for chat_id, user_id in BotAdmin.select(BotAdmin.chat_id, BotAdmin.user_id).tuples():
+            admins.setdefault(chat_id, set()).add(user_id)
+        self.admins = admins
+
+    def is_restricted(self, user_id: int) -> bool:
+        return user_id in self.restricted
+
+    def is_admin(self, chat_id: int, user_id: int) -> bool:
+        return user_id in BOOTSTRAP_ADMIN_IDS or user_id in self.admins.get(chat_id, ())
+
+    def restrict(self, user) -> bool:
+        if user.id in self.restricted:
+            return False
+        with db.atomic():
+            save_users([user])
+            RestrictedUser.create(user_id=user.id)
+        self.restricted.add(user.id)
+        return True
+
+    def unrestrict(self, user_id: int) -> bool:
+        if user_id not in self.restricted:
+            return False
+        RestrictedUser.delete().where(RestrictedUser.user_id == user_id).execute()
+        self.restricted.discard(user_id)
+        return True
+
+    def add_admin(self, chat_id: int, user) -> bool:
+        if self.is_admin(chat_id, user.id):
+            return False
+        with db.atomic():
+            save_users([user])
+            BotAdmin.insert(chat_id=chat_id, user_id=user.id).on_conflict_ignore().execute()
+        self.admins.setdefault(chat_id, set()).add(user.id)
+        return True
+
+    def remove_admin(self, chat_id: int, user_id: int) -> bool:
+        if user_id not in self.admins.get(chat_id, ()):
+            return False
+        BotAdmin.delete().where((BotAdmin.chat_id == chat_id) & (BotAdmin.user_id == user_id)).execute()
+        self.admins[chat_id].discard(user_id)
+        return True
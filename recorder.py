@@ -0,0 +1,155 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import pyrogram
+from pyrogram import types
+
+from mentions import text_length
+
+MAX_BYTES = 64 * 1024 * 1024
+BACKUP_COUNT = 10
+MAX_KNOWN_USERNAMES = 10_000
+_USERNAME_RE = re.compile(r"@[A-Za-z0-9_]{5,32}")
+
+
+class UpdateRecorder:
+    """
+    Запись входящих обновлений бота и селфбота в JSONL для воспроизведения (``benchmarks.replay``).
+
+    Обработчик ``record`` только обезличивает обновление и кладет строку в очередь;
+    в файл пишет отдельный поток ``QueueListener`` через ``RotatingFileHandler``
+    (``MAX_BYTES`` на файл, ``BACKUP_COUNT`` старых файлов), поэтому запись не задерживает
+    обработчики. ID пользователей и чатов заменяются ключевым хешем (одинаковым в пределах
+    ``salt``), имена убираются, ``@username`` в тексте заменяются псевдонимами, а смещения
+    сущностей пересчитываются под новую длину текста.
+    Аккаунты ботов не обезличиваются: на них завязаны фильтры селфбота, а ``/команда@бот``
+    при воспроизведении должна дойти до бота.
+    """
+
+    def __init__(self, path: str, salt: str = None, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT):
+        self.path = path
+        self._salt = (salt or os.urandom(16).hex()).encode()
+        self._started_at = time.monotonic()
+        self._user_ids: 'OrderedDict[str, int]' = OrderedDict()  # username -> user id, least recently seen first
+        self._bot_usernames: Set[str] = set()
+        self._queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        self._listener = QueueListener(self._queue, file_handler)
+        self._logger = logging.getLogger(f'{__name__}.{id(self)}')
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(QueueHandler(self._queue))
+        self.recorded = 0
+
+    def start(self):
+        self._listener.start()
+
+    def stop(self):
+        self._listener.stop()
+
+    # region anonymisation
+    def _pseudonym(self, value: Union[int, str]) -> int:
+        digest = hmac.new(self._salt, str(value).encode(), hashlib.blake2b).digest()
+        return int.from_bytes(digest[:6], 'big')
+
+    def _user(self, user: Optional[types.User]) -> Optional[Dict[str, Any]]:
+        if user is None:
+            return None
+        if user.is_bot:
+            if user.username:
+                self._bot_usernames.add(user.username.lower())
+            return {'id': user.id, 'bot': True, 'username': user.username}
+        if user.username:
+            self._user_ids[user.username.lower()] = user.id
+            self._user_ids.move_to_end(user.username.lower())
+            if len(self._user_ids) > MAX_KNOWN_USERNAMES:
+                self._user_ids.popitem(last=False)
+        pseudonym = self._pseudonym(user.id)
+        return {'id': pseudonym, 'username': f"u{pseudonym}" if user.username else None}
+
+    def _text(self, text: Optional[str], entities: Optional[List[types.MessageEntity]]) -> Tuple[Optional[str], Optional[List[list]]]:
+        """Текст с псевдонимами вместо ``@username`` и его сущности со сдвинутыми смещениями."""
+        if text is None:
+            return None, self._entities(entities, [])
+        text = str(text)
+        parts: List[str] = []
+        shifts: List[Tuple[int, int]] = []  # (UTF-16 end of a replaced mention, total length change so far)
+        last = delta = 0
+        for match in _USERNAME_RE.finditer(text):
+            replacement = self._mention(match)
+            parts += [text[last:match.start()], replacement]
+            delta += len(replacement) - len(match[0])  # both are ASCII, so UTF-16 lengths match
+            shifts.append((text_length(text[:match.end()]), delta))
+            last = match.end()
+        parts.append(text[last:])
+        return ''.join(parts), self._entities(entities, shifts)
+
+    def _mention(self, match: re.Match) -> str:
+        username = match[0][1:].lower()
+        if username in self._bot_usernames:
+            return match[0]
+        return f"@u{self._pseudonym(self._user_ids.get(username, username))}"
+
+    @staticmethod
+    def _shift(offset: int, shifts: List[Tuple[int, int]]) -> int:
+        moved = 0
+        for end, delta in shifts:
+            if end > offset:
+                break
+            moved = delta
+        return offset + moved
+
+    def _entities(self, entities: Optional[List[types.MessageEntity]], shifts: List[Tuple[int, int]]) -> Optional[List[list]]:
+        if not entities:
+            return None
+        encoded = []
+        for entity in entities:
+            start, end = self._shift(entity.offset, shifts), self._shift(entity.offset + entity.length, shifts)
+            encoded.append([entity.type.name, start, end - start, self._user(entity.user) if entity.user else None])
+        return encoded
+
+    def _message(self, message: types.Message) -> Dict[str, Any]:
+        text, text_entities = self._text(message.text, message.entities)
+        caption, caption_entities = self._text(message.caption, message.caption_entities)
+        return {
+            'id': message.id,
+            'chat': self._pseudonym(message.chat.id) if message.chat else None,
+            'user': self._user(message.from_user),
+            'text': text,
+            'caption': caption,
+            'entities': text_entities or caption_entities,
+            'media': message.media.name if message.media else None,
+            'reply_markup': type(message.reply_markup).__name__ if message.reply_markup else None,
+            'new_chat_members': [self._user(user) for user in message.new_chat_members] if message.new_chat_members else None,
+            'left_chat_member': self._user(message.left_chat_member),
+        }
+    # endregion
+
+    def encode(self, client: pyrogram.Client, update) -> Dict[str, Any]:
+        if client.me and client.me.is_bot and client.me.username:
+            self._bot_usernames.add(client.me.username.lower())
+        entry: Dict[str, Any] = {'t': round(time.monotonic() - self._started_at, 3), 'client': client.name}
+        if isinstance(update, types.Message):
+            entry.update(kind='message', **self._message(update))
+        elif isinstance(update, types.CallbackQuery):
+            entry.update(kind='callback_query', user=self._user(update.from_user), data=update.data,
+                         message=self._message(update.message) if update.message else None)
+        elif isinstance(update, types.ChatMemberUpdated):
+            member = update.new_chat_member or update.old_chat_member
+            entry.update(kind='chat_member', chat=self._pseudonym(update.chat.id), user=self._user(member.user if member else None),
+                         status=update.new_chat_member.status.name if update.new_chat_member else None)
+        return entry
+
+    async def record(self, client: pyrogram.Client, update):
+        self._logger.info(json.dumps(self.encode(client, update), ensure_ascii=False, separators=(',', ':')))
+        self.recorded += 1
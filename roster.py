@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Iterable
+
+import pyrogram
+from pyrogram import types
+from pyrogram.enums import ChatMemberStatus
+
+from metrics import metrics
+
+
+def is_bot_user(user: types.User) -> bool:
+    return user.is_bot or bool(user.username and user.username.lower().endswith('bot'))
+
+
+class ChatRoster:
+    """
+    Список участников одного чата, хранящийся в памяти.
+
+    Загружается при первом обращении, затем поддерживается событиями вступления/выхода;
+    полная перезагрузка раз в ``TTL`` секунд назначается планировщиком бота.
+    """
+    TTL = 30 * 60
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.users: Dict[int, types.User] = {}
+        self.loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, client: pyrogram.Client, force: bool = True):
+        async with self._lock:
+            if not force and self.loaded_at is not None:
+                return  # loaded by a concurrent caller while we waited for the lock
+            async with metrics.api_call('get_chat_members'):
+                users = {member.user.id: member.user async for member in client.get_chat_members(self.chat_id)}
+            self.users = users
+            self.loaded_at = time.monotonic()
+
+    async def members(self, client: pyrogram.Client) -> List[types.User]:
+        """Все участники чата, кроме ботов."""
+        if self.loaded_at is None:
+            await self.refresh(client, force=False)
+        return [user for user in self.users.values() if not is_bot_user(user)]
+
+    def add(self, users: Iterable[types.User]):
+        for user in users:
+            self.users[user.id] = user
+
+    def remove(self, user_id: int):
+        self.users.pop(user_id, None)
+
+    def apply_member_update(self, update: types.ChatMemberUpdated):
+        member = update.new_chat_member or update.old_chat_member
+        if member is None:
+            return
+        if update.new_chat_member is None or update.new_chat_member.status in (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED):
+            self.remove(member.user.id)
+        else:
+            self.add([member.user])
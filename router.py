@@ -0,0 +1,127 @@
+import re
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import pyrogram
+from pyrogram import types
+
+Handler = Callable[[pyrogram.Client, types.Message], Awaitable]
+Guard = Callable[[types.Message], bool]
+
+_MENTION_RE = re.compile(r"@(\w+)")
+_WORD_RE = re.compile(r"\S+")
+_ARGUMENT_RE = re.compile(r"([\"'])(.*?)(?<!\\)\1|(\S+)")  # the same as filters.command uses
+_ESCAPED_QUOTE_RE = re.compile(r"\\([\"'])")
+
+
+def parse_arguments(text: str) -> List[str]:
+    """Аргументы команды так же, как их разбирает ``filters.command``: текст в кавычках — один аргумент."""
+    if '"' not in text and "'" not in text:
+        return text.split()
+    return [_ESCAPED_QUOTE_RE.sub(r"\1", match[2] or match[3] or "") for match in _ARGUMENT_RE.finditer(text)]
+
+
+class Route(NamedTuple):
+    handler: Handler
+    guards: Tuple[Guard, ...] = ()
+
+    def allows(self, message: types.Message) -> bool:
+        return all(guard(message) for guard in self.guards)
+
+
+class CommandRouter:
+    """
+    Единый обработчик входящих сообщений бота.
+
+    Текст разбирается один раз: ``/команда``, ``<префикс> команда`` (``амш кто``),
+    команда без префикса (``шар``, ``@все``) и ``@группа``; обработчик ищется в словарях.
+    Перед вызовом выставляется ``message.command`` в том же виде, что и у
+    ``filters.command``. Свободные триггеры (``fallback``) проверяются по порядку
+    и только если ни одна команда не подошла.
+
+    Проверки (``guards``) вызываются по порядку после выбора маршрута; если команда
+    найдена, но проверка не прошла, сообщение дальше не обрабатывается.
+    """
+
+    def __init__(self, wrap: Callable[[Handler], Handler] = None):
+        self.wrap = wrap
+        self.slash: Dict[str, Route] = {}
+        self.bare: Dict[str, Route] = {}
+        self.prefixed: Dict[str, Dict[str, Route]] = {}
+        self._prefixed_max_words = 1
+        self.mention: Optional[Tuple[Callable[[str], bool], Route]] = None
+        self.fallbacks: List[Tuple[Callable[[types.Message], bool], Route]] = []
+
+    def _route(self, handler: Handler, guards: Tuple[Guard, ...]) -> Route:
+        return Route(self.wrap(handler) if self.wrap else handler, guards)
+
+    @staticmethod
+    def _names(names: Union[str, List[str]]) -> List[str]:
+        return [names.lower()] if isinstance(names, str) else [name.lower() for name in names]
+
+    def command(self, names: Union[str, List[str]], handler: Handler, *guards: Guard):
+        for name in self._names(names):
+            self.slash[name] = self._route(handler, guards)
+
+    def text(self, names: Union[str, List[str]], handler: Handler, *guards: Guard):
+        for name in self._names(names):
+            self.bare[name] = self._route(handler, guards)
+
+    def prefixed_command(self, prefixes: List[str], names: Union[str, List[str]], handler: Handler, *guards: Guard):
+        for prefix in self._names(prefixes):
+            commands = self.prefixed.setdefault(prefix, {})
+            for name in self._names(names):
+                commands[name] = self._route(handler, guards)
+                self._prefixed_max_words = max(self._prefixed_max_words, len(name.split()))
+
+    def mention_group(self, exists: Callable[[str], bool], handler: Handler, *guards: Guard):
+        self.mention = (exists, self._route(handler, guards))
+
+    def fallback(self, predicate: Callable[[types.Message], bool], handler: Handler, *guards: Guard):
+        self.fallbacks.append((predicate, self._route(handler, guards)))
+
+    def match(self, text: str, username: Optional[str] = None) -> Optional[Tuple[Route, List[str]]]:
+        """Найти команду в тексте. Возвращает маршрут и ``message.command``."""
+        words = text.split()
+        if not words:
+            return None
+        first = words[0].lower()
+
+        def arguments(command_words: int) -> List[str]:
+            end = 0
+            for _ in range(command_words):
+                end = _WORD_RE.search(text, end).end()
+            return parse_arguments(text[end:])
+
+        if first.startswith('/'):
+            name, _, target = first[1:].partition('@')
+            if target and username and target != username.lower():
+                return None
+            route = self.slash.get(name)
+            return (route, [name, *arguments(1)]) if route else None
+
+        if (commands := self.prefixed.get(first)) is not None:
+            for count in range(min(self._prefixed_max_words, len(words) - 1), 0, -1):
+                name = ' '.join(words[1:1 + count]).lower()
+                if route := commands.get(name):
+                    return route, [name, *arguments(1 + count)]
+
+        if route := self.bare.get(first):
+            return route, [first, *arguments(1)]
+
+        if self.mention and (mention := _MENTION_RE.match(first)) and self.mention[0](mention[1]):
+            return self.mention[1], [mention[1], *arguments(1)]
+        return None
+
+    async def dispatch(self, client: pyrogram.Client, message: types.Message):
+        if text := message.text or message.caption:
+            username = client.me.username if client.me else None
+            if matched := self.match(text, username):
+                route, message.command = matched
+                if route.allows(message):
+                    await route.handler(client, message)
+                return
+
+        for predicate, route in self.fallbacks:
+            if predicate(message) and route.allows(message):
+                await route.handler(client, message)
+                return
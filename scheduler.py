@@ -0,0 +1,154 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import random
+import traceback
+from collections import deque
+from typing import Callable, Optional, List, Dict, Set, Deque, Any
+
+
+class Job:
+    def __init__(self, scheduler: 'Scheduler', callback: Callable[[], Any], when: float,
+                 interval: Optional[float], jitter: float, name: str):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.when = when
+        self.interval = interval
+        self.jitter = jitter
+        self.name = name
+        self.cancelled = False
+        self.runs = 0
+
+    @property
+    def recurring(self) -> bool:
+        return self.interval is not None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __repr__(self):
+        return f"<Job {self.name} when={self.when:.1f} interval={self.interval}>"
+
+
+class LatenessStats:
+    """Насколько позже назначенного срабатывают задачи: счётчик, максимум и последние ``window`` значений."""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def add(self, lateness: float):
+        self.count += 1
+        self.max = max(self.max, lateness)
+        self.recent.append(lateness)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Scheduler:
+    """
+    Единый планировщик всех отложенных и периодических действий бота.
+
+    Задачи хранятся в куче по времени срабатывания и исполняются одной фоновой
+    корутиной на цикле asyncio. Коллбэк может быть обычной функцией или возвращать
+    корутину — тогда она запускается отдельной задачей.
+    """
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.lateness: Dict[str, LatenessStats] = {}
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_running_loop().time()
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.when, next(self._counter), job))
+        if self._heap[0][2] is job:
+            self._wakeup.set()
+
+    def call_later(self, delay: float, callback: Callable[[], Any], *, name: str = None, jitter: float = 0) -> Job:
+        when = self._now() + delay + (random.uniform(0, jitter) if jitter else 0)
+        job = Job(self, callback, when, None, jitter, name or getattr(callback, '__name__', 'job'))
+        self._push(job)
+        return job
+
+    def call_every(self, interval: float, callback: Callable[[], Any], *, name: str = None,
+                   jitter: float = 0, first_delay: float = None) -> Job:
+        delay = interval if first_delay is None else first_delay
+        when = self._now() + delay + (random.uniform(0, jitter) if jitter else 0)
+        job = Job(self, callback, when, interval, jitter, name or getattr(callback, '__name__', 'job'))
+        self._push(job)
+        return job
+
+    @property
+    def jobs(self) -> List[Job]:
+        return sorted((job for _, _, job in self._heap if not job.cancelled), key=lambda job: job.when)
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def _run(self):
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - self._now()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, job = heapq.heappop(self._heap)
+            self._fire(job)
+
+    def _fire(self, job: Job):
+        now = self._now()
+        self.lateness.setdefault(job.name, LatenessStats()).add(now - job.when)
+        job.runs += 1
+        if job.recurring:
+            job.when = now + job.interval + (random.uniform(0, job.jitter) if job.jitter else 0)
+            self._push(job)
+        try:
+            result = job.callback()
+        except Exception:
+            traceback.print_exc()
+            return
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            traceback.print_exception(task.exception())
+
+    def report(self) -> str:
+        lines = []
+        for name, stats in sorted(self.lateness.items()):
+            lines.append(f"{name}: {stats.count} runs, late p50 {stats.percentile(0.5) * 1000:.1f} ms, "
+                         f"p99 {stats.percentile(0.99) * 1000:.1f} ms, max {stats.max * 1000:.1f} ms")
+        return '\n'.join(lines)
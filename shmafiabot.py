@@ -1,41 +1,57 @@
 import asyncio
-import enum
 import os
 import random
 import re
-from datetime import datetime
-from typing import Union, List, Tuple, Dict, Optional
-import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Union, List, Tuple, Dict, Optional, Callable, Awaitable
 
-import peewee
 import pyrogram
 from pyrogram import filters, types
 from pyrogram.enums import ParseMode
-from pyrogram.handlers import MessageHandler, CallbackQueryHandler
+from pyrogram.handlers import MessageHandler, CallbackQueryHandler, ChatMemberUpdatedHandler
 
+from chat_state import ChatRegistry
+from crocodile import WordDeck, WordHistory, GuessMatcher, FuzzyGuessMatcher
 from crocodile_words import Words
-from db import GroupAffiliation, RestrictedUser, Config
+from config_cache import ConfigCache, ConfigKey
+from cooldowns import Cooldowns, CooldownRule
+from db import CrocodileWordHistory, create_schema, inline_query_stats, run_db
+from fishing import FISHING_BOT_ID, FISHING_MESSAGE_RE, FishingSession, parse_fishing
+from mention_groups import MentionGroupIndex
+from loop_monitor import LoopMonitor
+from metrics import metrics
+from mentions import MentionCache, RenderedMention, pack_mentions, text_length
+from moderation import ModerationQueue
+from outbox import Outbox
+from permissions import PermissionIndex
+from recorder import UpdateRecorder
+from roster import ChatRoster
+from router import CommandRouter
+from scheduler import Scheduler, Job
+from triggers import TriggerIndex
 
-CHAT_ID = int(os.getenv('CHAT_ID'))
+CHAT_IDS: List[int] = [int(chat_id) for chat_id in os.getenv('CHAT_IDS', os.getenv('CHAT_ID')).split(',')]
+METRICS_FILE: Optional[str] = os.getenv('METRICS_FILE')
+RECORD_UPDATES: Optional[str] = os.getenv('RECORD_UPDATES')
+PIPISA_BOT_ID = 1264548383
 
 
-def text_command(strings: Union[str, List[str]]):
-    return chat_command(strings, prefix='')
+AMSH_PREFIXES = ['амш', 'ашм']
+_CHAT_IDS_LOOKUP = frozenset(CHAT_IDS)
 
 
-def chat_command(commands: Union[str, List[str]], prefix: Union[str, List[str]] = 0):
-    kwargs = {}
-    if prefix != 0:
-        kwargs['prefixes'] = prefix
-    return filters.command(commands, **kwargs) & filters.chat(CHAT_ID)
+def in_chats(message: types.Message) -> bool:
+    return message.chat.id in _CHAT_IDS_LOOKUP
 
 
-def amsh_command(strings: Union[str, List[str]]):
-    return chat_command(strings, prefix=['амш ', 'Амш ', 'ашм ', 'Ашм '])
+def _update_in_chats(_, __, update) -> bool:
+    # filters.chat reads update.chat, which callback queries do not have
+    chat = update.message.chat if isinstance(update, types.CallbackQuery) and update.message else getattr(update, 'chat', None)
+    return chat is not None and chat.id in _CHAT_IDS_LOOKUP
 
 
-def admin_command(commands: Union[str, List[str]]):
-    return chat_command(commands) & filters.user([356786682, 633834276, 209007669, 55539711])  # яся, Марьям, дед
+update_in_chats = filters.create(_update_in_chats)
 
 
 # def crocodile_game_check(func):
@@ -48,40 +64,94 @@ def admin_command(commands: Union[str, List[str]]):
 #     return wrap
 
 
-class PingGroup(enum.Enum):
-    ALL = 1
-    DORM = 2
-
-
-class ConfigKey:
-    ANTI_FISHING = 'anti_fishing'
-    ANTI_PIPISA_ADS = 'anti_pipisa_ads'
-    PIPISA_AD_TEXT_REPLACEMENT = 'pipisa_ad_text_replacement'
-
-
 class CrocodileGame:
     BECOME_PRESENTER_TIMEOUT = 7
     BECOME_PRESENTER_END_GAME_TIMEOUT = 60
+    FUZZY_ARGS = ("fuzzy", "нечетко", "нечётко")
 
     class CallbackQueries:
         SHOW_WORD = "show_word"
         NEXT_WORD = "next_word"
         BECOME_PRESENTER = "become_presenter"
 
-    def __init__(self, presenter: types.User):
-        self.WORDS: Words = Words()
-        self.recent_words = []
-        self.word: str = self.pick_word()
+    def __init__(self, chat_id: int, presenter: types.User, history: Optional[WordHistory] = None, fuzzy: bool = False):
+        self.chat_id = chat_id
+        self.fuzzy = fuzzy
+        self.deck: WordDeck = WordDeck(Words.ALL, history)
+        self.word: str = ''
+        self.matcher: Optional[GuessMatcher] = None
+        self.pick_word()
         self.presenter: types.User = presenter
         self.reserved_presenter: Optional[types.User] = None
+        self._handoff_timers: List[Job] = []
 
     def pick_word(self):
-        self.word = random.choice([word for word in self.WORDS.ALL if word not in self.recent_words])
-        self.recent_words.append(self.word)
+        self.word = self.deck.draw()
+        self.matcher = FuzzyGuessMatcher(self.word) if self.fuzzy else GuessMatcher(self.word)
         return self.word
 
+    def start_handoff(self, scheduler: Scheduler, reserved_presenter: types.User, on_abandoned: Callable[[], Awaitable]):
+        """
+        Передать ход отгадавшему: ``BECOME_PRESENTER_TIMEOUT`` секунд эстафету может принять
+        только он, затем любой, а через ``BECOME_PRESENTER_END_GAME_TIMEOUT`` вызывается ``on_abandoned``.
+        """
+        self.cancel_handoff()
+        self.presenter = None
+        self.reserved_presenter = reserved_presenter
+        self._handoff_timers = [
+            scheduler.call_later(self.BECOME_PRESENTER_TIMEOUT, self._release_reservation, name="crocodile_release_reservation"),
+            scheduler.call_later(self.BECOME_PRESENTER_END_GAME_TIMEOUT, on_abandoned, name="crocodile_abandoned"),
+        ]
+
+    def finish_handoff(self, presenter: types.User):
+        self.cancel_handoff()
+        self.presenter = presenter
+        self.reserved_presenter = None
+
+    def cancel_handoff(self):
+        for timer in self._handoff_timers:
+            timer.cancel()
+        self._handoff_timers = []
+
+    def _release_reservation(self):
+        self.reserved_presenter = None
+
+    def is_guess(self, message: types.Message) -> bool:
+        return (self.presenter is not None and message.from_user is not None
+                and message.from_user.id != self.presenter.id and self.matcher.matches(message.text))
+
+
+class ChatState:
+    """Всё, что бот помнит об одном чате."""
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.roster = ChatRoster(chat_id)
+        self.crocodile_game: Optional[CrocodileGame] = None
+        self.word_history: Optional[WordHistory] = None
+        self.current_antipair: Optional[Tuple[types.User, types.User]] = None
+        self.fishing_sessions: Dict[int, FishingSession] = {}  # fisher id -> session
+
 
 class ShmafiaBot:
+    MENTION_GROUPS_RELOAD_INTERVAL = 10 * 60
+    TRIGGERS_RELOAD_INTERVAL = 10 * 60
+    CHAT_EVICTION_INTERVAL = 10 * 60
+    CONFIG_POLL_INTERVAL = 30
+    COOLDOWNS_PURGE_INTERVAL = 5 * 60
+    METRICS_WRITE_INTERVAL = 15
+    FISHING_SESSION_TIMEOUT = 30
+    COOLDOWNS: Dict[str, CooldownRule] = {
+        "ping_all": CooldownRule(per_user=5 * 60, per_chat=60),
+        "ping_group": CooldownRule(per_user=2 * 60, per_chat=30),
+        "whos_today": CooldownRule(per_user=10),
+        "a8ball": CooldownRule(per_user=5),
+        "d20": CooldownRule(per_user=3),
+        "antipair": CooldownRule(per_user=30),
+        "crocodile_start": CooldownRule(per_user=30, per_chat=10),
+        "trigger": CooldownRule(per_chat=60, notify=False),
+    }
+
     def __init__(
             self,
             name: str,
@@ -97,51 +167,169 @@ class ShmafiaBot:
         self.selfbot: Optional[pyrogram.Client] = None
         # self.bot = pyrogram.Client(name, api_id, api_hash, bot_token=bot_token)
         # self.selfbot = pyrogram.Client(name+"_selfbot", api_id, api_hash)
-        self.config: Dict[ConfigKey: bool] = {
-            ConfigKey.ANTI_FISHING: bool(Config.get(Config.key == ConfigKey.ANTI_FISHING).value),
-            ConfigKey.ANTI_PIPISA_ADS: bool(Config.get(Config.key == ConfigKey.ANTI_PIPISA_ADS).value),
-        }
-        self.current_antipair: Optional[Tuple[str, Tuple[types.ChatMember, types.ChatMember]]] = None
+        self.config = ConfigCache()
+        self.config.on_change(self._config_changed)
         self.ANTIPAIR_TIMEDELTA: int = 6
-        self.crocodile_game: Optional[CrocodileGame] = None
+        self.next_antipair_at: datetime = self._next_antipair_rotation()
+        self.chats: ChatRegistry[ChatState] = ChatRegistry(
+            ChatState,
+            on_evict=self._evict_chat_state,
+            is_busy=lambda state: state.crocodile_game is not None or bool(state.fishing_sessions)
+        )
+        self.scheduler = Scheduler()
+        self.loop_monitor = LoopMonitor()
+        self.mention_groups = MentionGroupIndex()
+        self.triggers = TriggerIndex()
+        self.permissions = PermissionIndex()
+        self.outbox = Outbox()
+        self.moderation = ModerationQueue(self.outbox, self.scheduler)
+        self.mention_cache = MentionCache()
+        self.cooldowns = Cooldowns(self.COOLDOWNS)
+        self.recorder: Optional[UpdateRecorder] = UpdateRecorder(RECORD_UPDATES, os.getenv('RECORD_SALT')) if RECORD_UPDATES else None
+        self.router = self._build_router()
+
+    def _reply(self, message: types.Message, text: str, **kwargs) -> 'asyncio.Future[types.Message]':
+        return self.outbox.reply(self.bot, message, text, **kwargs)
+
+    def _is_admin(self, message: types.Message) -> bool:
+        return message.from_user is not None and self.permissions.is_admin(message.chat.id, message.from_user.id)
+
+    def _cooldown(self, command: str):
+        """Проверка маршрута, отбрасывающая слишком частые вызовы команды; ставится последней."""
+        def check(message: types.Message) -> bool:
+            if message.from_user is None or self.permissions.is_admin(message.chat.id, message.from_user.id):
+                return True
+            allowed, retry_in = self.cooldowns.hit(command, message.chat.id, message.from_user.id)
+            if retry_in is not None:
+                notice = self._reply(message, f"Не так часто! Попробуйте через {retry_in:.0f} с", quote=True)
+                notice.add_done_callback(lambda future: future.cancelled() or future.exception())
+            return allowed
+        return check
+
+    def _build_router(self) -> CommandRouter:
+        router = CommandRouter(wrap=metrics.handler)
+        admin = (in_chats, self._is_admin)
+        router.command(["set_nametag", "change_nametag"], self.set_title_command, in_chats)
+        router.command(["restrict_member", "unrestrict_member"], self.un_restrict_member_command, *admin)
+        router.text(["@все", "@all", "@типавсе"], self.ping_all, in_chats, self._cooldown("ping_all"))
+        router.mention_group(lambda name: self.mention_groups.members(name) is not None, self.ping_group, in_chats, self._cooldown("ping_group"))
+        router.command("groups", self.groups_command, in_chats)
+        router.command(["create_group", "delete_group", "add_to_group", "remove_from_group"], self.manage_group_command, *admin)
+        router.text("шар", self.a8ball, in_chats, self._cooldown("a8ball"))
+        router.command("config", self.config_command, in_chats)
+        router.command("help", self.help_command)
+        router.command("jobs", self.jobs_command, *admin)
+        router.command("outbox", self.outbox_command, *admin)
+        router.command("perf", self.perf_command, *admin)
+        router.command(["add_admin", "remove_admin"], self.manage_admin_command, *admin)
+        router.command("admins", self.admins_command, *admin)
+        router.prefixed_command(AMSH_PREFIXES, "d20", self.d20, in_chats, self._cooldown("d20"))
+        router.prefixed_command(AMSH_PREFIXES, "кто", self.whos_today, in_chats, self._cooldown("whos_today"))
+        router.prefixed_command(AMSH_PREFIXES, "антипара дня", self.antipair, in_chats, self._cooldown("antipair"))
+        router.command("start_crocodile", self.crocodile_start, in_chats, self._cooldown("crocodile_start"))
+        router.command(["end_crocodile", "stop_crocodile"], self.crocodile_end_game, in_chats)
+        router.command("triggers", self.triggers_command, in_chats)
+        router.command(["add_trigger_phrase", "add_trigger_response", "delete_trigger"], self.manage_trigger_command, *admin)
+        router.fallback(self._match_trigger, self.trigger_reply, in_chats, self._cooldown("trigger"))
+        router.fallback(lambda m: bool(m.text) and (game := self._crocodile_game(m.chat.id)) is not None and game.is_guess(m), self.crocodile_messages_listener)
+        return router
 
     async def _set_title(self, message, chat, author, title):
         for _ in range(2):
             try:
-                return await self.bot.set_administrator_title(
-                    chat_id=chat.id,
-                    user_id=author.id,
-                    title=title
-                )
+                async with metrics.api_call('set_administrator_title'):
+                    return await self.bot.set_administrator_title(
+                        chat_id=chat.id,
+                        user_id=author.id,
+                        title=title
+                    )
             except pyrogram.errors.exceptions.bad_request_400.ChatAdminRequired:
-                await message.reply("Не смог установить плашку."
-                                    "\nВозможные причины:"
-                                    "\n- Я не удминистратор"
-                                    "\n- У меня нет прав на добавление новых администраторов"
-                                    "\n- Вы уже являетесь администратором. Попросить снять с себя роль")
+                await self._reply(message, "Не смог установить плашку."
+                                           "\nВозможные причины:"
+                                           "\n- Я не удминистратор"
+                                           "\n- У меня нет прав на добавление новых администраторов"
+                                           "\n- Вы уже являетесь администратором. Попросить снять с себя роль")
                 return False
             except pyrogram.errors.exceptions.bad_request_400.UserCreator:
-                await message.reply("Я не могу установить Вашу плашку")
+                await self._reply(message, "Я не могу установить Вашу плашку")
                 return False
             except pyrogram.errors.exceptions.bad_request_400.AdminRankInvalid:
-                await message.reply("У Вас плашка длиннее 16 символов или просто неправильная")
+                await self._reply(message, "У Вас плашка длиннее 16 символов или просто неправильная")
                 return False
             except ValueError:
-                await chat.promote_member(
-                    user_id=author.id,
-                    privileges=types.ChatPrivileges(
-                        # can_manage_chat=False,
-                        # can_invite_users=False
+                async with metrics.api_call('promote_chat_member'):
+                    await chat.promote_member(
+                        user_id=author.id,
+                        privileges=types.ChatPrivileges(
+                            # can_manage_chat=False,
+                            # can_invite_users=False
+                        )
                     )
-                )
 
-    async def _random_members(self, chat: types.Chat, n: int = 1, exclude_ids: List[int] = None) -> Union[types.ChatMember, List[types.ChatMember]]:
+    @staticmethod
+    def _config_changed(chat_id: Optional[int], key: str, value):
+        print(f"Config {key} = {value!r}" + (f" in chat {chat_id}" if chat_id is not None else ''))
+
+    def _evict_chat_state(self, state: ChatState):
+        asyncio.ensure_future(self._save_word_history(state, force=True))
+
+    def _schedule_jobs(self):
+        self.scheduler.call_every(ChatRoster.TTL, self._refresh_rosters, name="roster_refresh", jitter=60)
+        self.scheduler.call_every(self.CHAT_EVICTION_INTERVAL, self.chats.evict_idle, name="chat_eviction")
+        self.scheduler.call_every(self.CONFIG_POLL_INTERVAL, self.config.poll, name="config_poll", jitter=5)
+        self.scheduler.call_every(self.COOLDOWNS_PURGE_INTERVAL, self.cooldowns.purge, name="cooldowns_purge")
+        self.scheduler.call_every(self.MENTION_GROUPS_RELOAD_INTERVAL, self.mention_groups.reload, name="mention_groups_reload", jitter=30)
+        self.scheduler.call_every(self.TRIGGERS_RELOAD_INTERVAL, self.triggers.reload, name="triggers_reload", jitter=30)
+        if METRICS_FILE:
+            self.scheduler.call_every(self.METRICS_WRITE_INTERVAL, lambda: asyncio.to_thread(metrics.write_textfile, METRICS_FILE), name="metrics_write")
+        self._schedule_antipair_rotation()
+
+    def _next_antipair_rotation(self) -> datetime:
+        now = datetime.now()
+        period_start = now.replace(hour=now.hour // self.ANTIPAIR_TIMEDELTA * self.ANTIPAIR_TIMEDELTA, minute=0, second=0, microsecond=0)
+        return period_start + timedelta(hours=self.ANTIPAIR_TIMEDELTA)
+
+    def _schedule_antipair_rotation(self):
+        self.next_antipair_at = self._next_antipair_rotation()
+        delay = (self.next_antipair_at - datetime.now()).total_seconds()
+        self.scheduler.call_later(delay, self._rotate_antipair, name="antipair_rotation")
+
+    def _rotate_antipair(self):
+        for state in self.chats.values():
+            state.current_antipair = None
+        self._schedule_antipair_rotation()
+
+    async def _refresh_rosters(self):
+        for state in self.chats.values():
+            if state.roster.loaded_at is not None:
+                try:
+                    await state.roster.refresh(self.bot)
+                except Exception:
+                    print(f"Failed to refresh the roster of chat {state.chat_id}:")
+                    traceback.print_exc()
+
+    def _roster(self, chat_id: int) -> ChatRoster:
+        return self.chats.get(chat_id).roster
+
+    async def _chat_members(self, chat: types.Chat) -> List[types.User]:
+        return await self._roster(chat.id).members(self.bot)
+
+    async def _random_members(self, chat: types.Chat, n: int = 1, exclude_ids: List[int] = None) -> Union[types.User, List[types.User]]:
         exclude_ids = exclude_ids or []
-        members = [member async for member in chat.get_members() if
-                   (not member.user.username) or (not member.user.username.lower().endswith('bot') and member.user.id not in exclude_ids)]
+        members = [user for user in await self._chat_members(chat) if user.id not in exclude_ids]
         return random.choice(members) if n == 1 else random.sample(members, n)
 
-    # @bot.on_message(chat_command(["set_nametag", "change_nametag"]))
+    async def roster_member_updated(self, _, update: types.ChatMemberUpdated):
+        self._roster(update.chat.id).apply_member_update(update)
+
+    async def roster_service_message(self, _, message: types.Message):
+        roster = self._roster(message.chat.id)
+        if message.new_chat_members:
+            roster.add(message.new_chat_members)
+        if message.left_chat_member:
+            roster.remove(message.left_chat_member.id)
+
+    # router.command(["set_nametag", "change_nametag"])
     async def set_title_command(self, _, message: types.Message):
         """
         Установить или изменить плашку.
@@ -151,13 +339,13 @@ class ShmafiaBot:
         """
         author = message.from_user
 
-        if RestrictedUser.get_or_none(RestrictedUser.user_id == author.id):
-            await message.reply("Вам запретили изменять плашку")
+        if self.permissions.is_restricted(author.id):
+            await self._reply(message, "Вам запретили изменять плашку")
             return
 
         args = message.command[1:]
         if not args:
-            await message.reply("Не указано название плашки.")
+            await self._reply(message, "Не указано название плашки.")
             return
 
         title = ' '.join(args)
@@ -165,14 +353,14 @@ class ShmafiaBot:
         chat = message.chat
 
         if result := await self._set_title(message, chat, author, title):
-            await message.reply(f"Ваша плашка была успешно изменена на `{title}`.")
+            await self._reply(message, f"Ваша плашка была успешно изменена на `{title}`.")
         elif result is False:
             print('idk')
         else:
             print(result)
-            await message.reply(f"Что-то пошло не так, попробуйте снова")
+            await self._reply(message, f"Что-то пошло не так, попробуйте снова")
 
-    # @bot.on_message(admin_command(["restrict_member", "unrestrict_member"]))
+    # router.command(["restrict_member", "unrestrict_member"], <админ>)
     async def un_restrict_member_command(self, _, message: types.Message):
         """
         Разрешить или запретить участнику изменять плашку
@@ -182,7 +370,7 @@ class ShmafiaBot:
         """
         if entities := message.entities:
             if len(entities) < 2:
-                await message.reply("Пользователь не указан", quote=True)
+                await self._reply(message, "Пользователь не указан", quote=True)
                 return
 
             to_restrict = False if message.command[0].startswith('un') else True
@@ -194,9 +382,10 @@ class ShmafiaBot:
                 offset = entity.offset
                 member = message.text[offset:offset + entity.length]
                 try:
-                    member = await chat.get_member(member)
+                    async with metrics.api_call('get_chat_member'):
+                        member = await chat.get_member(member)
                 except pyrogram.errors.exceptions.bad_request_400.UserNotParticipant:
-                    await message.reply("Указанный пользователь не является участником чата.")
+                    await self._reply(message, "Указанный пользователь не является участником чата.")
                     return
                 else:
                     member = member.user
@@ -205,51 +394,138 @@ class ShmafiaBot:
 
             if member:
                 if to_restrict:
-                    try:
-                        RestrictedUser.create(user_id=member.id)
-                    except peewee.IntegrityError:
-                        await message.reply("Указанный пользователь уже ограничен")
+                    if not await run_db(self.permissions.restrict, member):
+                        await self._reply(message, "Указанный пользователь уже ограничен")
                         return
                 else:
-                    if not RestrictedUser.delete().where(RestrictedUser.user_id == member.id).execute():
-                        await message.reply("Указанный пользователь не ограничен")
+                    if not await run_db(self.permissions.unrestrict, member.id):
+                        await self._reply(message, "Указанный пользователь не ограничен")
                         return
-                await message.reply("Пользователь успешено был ограничен" if to_restrict else "С пользователя успешно были сняты ограничения")
+                await self._reply(message, "Пользователь успешено был ограничен" if to_restrict else "С пользователя успешно были сняты ограничения")
             else:
-                await message.reply(f"Пользователь не найден")
+                await self._reply(message, f"Пользователь не найден")
 
-    async def ping_func(self, message: types.Message, group: PingGroup):
-        chat = message.chat
-        all_members = [member async for member in chat.get_members() if not (member.user.username.lower().endswith('bot') if member.user.username else False)]
-        match group:
-            case PingGroup.DORM:
-                mentions = [member.user.mention for member in all_members if GroupAffiliation.get_or_none(GroupAffiliation.user_id == member.user.id)]
-                text_part = "отметить общажников"
-            case PingGroup.ALL | _:
-                mentions = [member.user.mention for member in all_members]
-                text_part = "всех отметить"
-
-        ping_message = ' '.join(message.command[1:]) if len(message.command) > 1 else None
-        mentions_messages = [' '.join(mentions[i:i + 50]) for i in range(0, len(mentions), 50)]  # 50
-        if ping_message:
-            mentions_messages[0] = ping_message + '\n' + mentions_messages[0]
-        else:
-            mentions_messages[0] = f"ВНИМАНИЕ❗️❗️❗\n{message.from_user.mention} решил(а) {text_part}\n" + mentions_messages[0]
-        for mentions_message in mentions_messages:
-            await message.reply(mentions_message)
+    async def _mentioned_users(self, message: types.Message) -> List[types.User]:
+        users = []
+        for entity in message.entities or []:
+            if entity.type == pyrogram.enums.MessageEntityType.MENTION:
+                username = message.text[entity.offset:entity.offset + entity.length]
+                try:
+                    async with metrics.api_call('get_chat_member'):
+                        users.append((await message.chat.get_member(username)).user)
+                except pyrogram.errors.exceptions.bad_request_400.UserNotParticipant:
+                    continue
+            elif entity.type == pyrogram.enums.MessageEntityType.TEXT_MENTION:
+                users.append(entity.user)
+        return users
 
-    # @bot.on_message(text_command(["@все", "@all"]))
+    async def ping_func(self, message: types.Message, users: List[types.User], text_part: str, args: List[str]):
+        mentions = [self.mention_cache.render(user) for user in users]
+        if not mentions:
+            await self._reply(message, "Некого отметить", quote=True)
+            return
+
+        if args:
+            ping_message = ' '.join(args)
+            header, header_entities = RenderedMention(ping_message, text_length(ping_message)), 0
+        else:
+            author = self.mention_cache.render(message.from_user)
+            header_template = "ВНИМАНИЕ❗️❗️❗\n{} решил(а) " + text_part
+            header = RenderedMention(header_template.format(author.text), text_length(header_template.format('')) + author.length)
+            header_entities = 1
+        mentions_messages = pack_mentions(mentions, header, header_entities)
+        await asyncio.gather(*[self._reply(message, mentions_message) for mentions_message in mentions_messages])
+
+    # router.text(["@все", "@all"])
     async def ping_all(self, _, message: types.Message):
-        await self.ping_func(message, PingGroup.ALL)
+        await self.ping_func(message, await self._chat_members(message.chat), "всех отметить", message.command[1:])
+
+    # router.mention_group(<группа существует>, ...)
+    async def ping_group(self, _, message: types.Message):
+        name = message.command[0]
+        if (member_ids := self.mention_groups.members(name)) is None:
+            return
+
+        users = [user for user in await self._chat_members(message.chat) if user.id in member_ids]
+        await self.ping_func(message, users, f"отметить @{name.lower()}", message.command[1:])
+
+    # router.command(["add_admin", "remove_admin"], <админ>)
+    async def manage_admin_command(self, _, message: types.Message):
+        """
+        Назначить или снять администратора бота
+
+        :param message:
+        :return:
+        """
+        if not (users := await self._mentioned_users(message)):
+            await self._reply(message, "Пользователь не указан", quote=True)
+            return
 
-    # @bot.on_message(text_command("@общажники"))
-    async def ping_dorm(self, _, message: types.Message):
-        await self.ping_func(message, PingGroup.DORM)
+        if message.command[0] == "add_admin":
+            added = [user.mention for user in users if await run_db(self.permissions.add_admin, message.chat.id, user)]
+            await self._reply(message, f"Назначены администраторами: {', '.join(added)}" if added else "Все указанные уже администраторы", quote=True)
+        else:
+            removed = [user.mention for user in users if await run_db(self.permissions.remove_admin, message.chat.id, user.id)]
+            await self._reply(message, f"Сняты с администраторов: {', '.join(removed)}" if removed else "Никого не удалось снять", quote=True)
+
+    # router.command("admins", <админ>)
+    async def admins_command(self, _, message: types.Message):
+        admins = [user.mention for user in await self._chat_members(message.chat) if self.permissions.is_admin(message.chat.id, user.id)]
+        await self._reply(message, "Администраторы бота в этом чате:\n" + ('\n'.join(f"• {mention}" for mention in admins) or '—'), quote=True)
+
+    # router.command("groups")
+    async def groups_command(self, _, message: types.Message):
+        if not (names := self.mention_groups.names()):
+            await self._reply(message, "Групп пока нет", quote=True)
+            return
+        await self._reply(message, "Группы для упоминания:\n" + '\n'.join(
+            f"• @{name} ({len(self.mention_groups.members(name))})" for name in names
+        ), quote=True)
 
-    # @bot.on_message(text_command("шар"))
+    # router.command(["create_group", "delete_group", "add_to_group", "remove_from_group"], <админ>)
+    async def manage_group_command(self, _, message: types.Message):
+        """
+        Создать/удалить группу упоминания или изменить её состав
+
+        :param message:
+        :return:
+        """
+        if len(message.command) < 2:
+            await self._reply(message, "Не указано название группы", quote=True)
+            return
+
+        name = message.command[1].lstrip('@')
+        match message.command[0]:
+            case "create_group":
+                if not re.fullmatch(r"\w+", name):
+                    await self._reply(message, "Название группы может состоять только из букв, цифр и _", quote=True)
+                elif await self.mention_groups.create_group(name):
+                    await self._reply(message, f"Группа @{name.lower()} создана", quote=True)
+                else:
+                    await self._reply(message, "Такая группа уже существует", quote=True)
+            case "delete_group":
+                if await self.mention_groups.delete_group(name):
+                    await self._reply(message, f"Группа @{name.lower()} удалена", quote=True)
+                else:
+                    await self._reply(message, "Такой группы нет", quote=True)
+            case "add_to_group" | "remove_from_group" as command:
+                if self.mention_groups.members(name) is None:
+                    await self._reply(message, "Такой группы нет", quote=True)
+                    return
+                if not (users := await self._mentioned_users(message)):
+                    await self._reply(message, "Пользователи не указаны", quote=True)
+                    return
+                if command == "add_to_group":
+                    count = await self.mention_groups.add_members(name, users)
+                    await self._reply(message, f"В группу @{name.lower()} добавлено участников: {count}", quote=True)
+                else:
+                    count = await self.mention_groups.remove_members(name, [user.id for user in users])
+                    await self._reply(message, f"Из группы @{name.lower()} убрано участников: {count}", quote=True)
+
+    # router.text("шар")
     async def a8ball(self, _, message: types.Message):
         if len(message.command) < 2:
-            await message.reply("Я не вижу вопроса", quote=True)
+            await self._reply(message, "Я не вижу вопроса", quote=True)
             return
 
         ball_answers = [
@@ -258,268 +534,370 @@ class ShmafiaBot:
             "Пока не ясно, попробуй снова", "Спроси позже", "Лучше не рассказывать", "Сейчас нельзя предсказать", "Сконцентрируйся и спроси опять",
             "Даже не думай", "Мой ответ — «нет»", "По моим данным — «нет»", "Перспективы не очень хорошие", "Весьма сомнительно"
         ]
-        await message.reply(random.choice(ball_answers), quote=True)
+        await self._reply(message, random.choice(ball_answers), quote=True)
 
-    # @bot.on_message(filters.regex(r"^🎣 \[Рыбалка\] 🎣") & filters.user(200164142) & filters.chat(CHAT_ID))
+    # selfbot: filters.regex(FISHING_MESSAGE_RE) & filters.user(FISHING_BOT_ID) & filters.chat(CHAT_IDS)
     async def fishing_msg_deletion(self, _, message: types.Message):
-        if not self.config[ConfigKey.ANTI_FISHING]:
+        """
+        Копить подряд идущие сообщения рыбалки одного рыбака; когда энергия кончилась или рыбак
+        замолчал на ``FISHING_SESSION_TIMEOUT`` секунд, отправить одну сводку и удалить всю ветку разом.
+        """
+        if not self.config.get(ConfigKey.ANTI_FISHING, message.chat.id):
             return
 
-        message._client = self.bot
-        if you_receive := re.search(r"Вы получаете (.+)", message.text):
-            you_receive = you_receive[1]
-        if energy_left := re.search(r"Энергии осталось: (.+)", message.text):
-            energy_left = energy_left[1]
-        if you_receive and energy_left:
-            text = f"{you_receive}\n{energy_left}"
-        elif energy_left:
-            text = f"ничего\n{energy_left}"
+        state = self.chats.get(message.chat.id)
+        reply_to = message.reply_to_message
+        fisher_id = reply_to.from_user.id if reply_to and reply_to.from_user else 0
+        session = state.fishing_sessions.setdefault(fisher_id, FishingSession())
+        session.add(message.id, parse_fishing(message.text))
+        if session.timer:
+            session.timer.cancel()
+        if session.finished:
+            await self._flush_fishing_session(state, fisher_id)
         else:
-            text = f"нет энергии"
+            session.timer = self.scheduler.call_later(self.FISHING_SESSION_TIMEOUT, lambda: self._flush_fishing_session(state, fisher_id),
+                                                      name="fishing_session_flush")
 
-        await message.reply(text)
-        await message.delete()
+    async def _flush_fishing_session(self, state: ChatState, fisher_id: int):
+        if (session := state.fishing_sessions.pop(fisher_id, None)) is None:
+            return
+        if session.timer:
+            session.timer.cancel()
+        self.moderation.delete(self.bot, state.chat_id, session.message_ids, replacement=session.summary())
 
-    # @bot.on_message(filters.media & filters.user(1264548383) & filters.chat(CHAT_ID))
+    # selfbot: (filters.reply_keyboard | filters.inline_keyboard) & filters.user(PIPISA_BOT_ID) & filters.chat(CHAT_IDS)
     async def pipisa_bot_ad_remover(self, _, message: types.Message):
-        if not self.config[ConfigKey.ANTI_PIPISA_ADS]:
+        if not self.config.get(ConfigKey.ANTI_PIPISA_ADS, message.chat.id):
             return
 
-        message._client = self.bot
-        await message.delete()
-        ad_text_replacement: str = Config.get(Config.key == ConfigKey.PIPISA_AD_TEXT_REPLACEMENT).value
-        ad_text_replacement = ad_text_replacement.strip()
-        await message.reply(ad_text_replacement)
+        ad_text_replacement: str = self.config.get(ConfigKey.PIPISA_AD_TEXT_REPLACEMENT, message.chat.id).strip()
+        self.moderation.delete(self.bot, message.chat.id, [message.id], replacement=ad_text_replacement or None)
 
-    def toggle_config_variable(self, key: Union[str, ConfigKey]) -> bool:
-        toggled = not self.config[key]
-        self.config[key] = toggled
-        Config.update(value=toggled).where(Config.key == key).execute()
+    async def toggle_config_variable(self, chat_id: int, key: Union[str, ConfigKey]) -> bool:
+        toggled = not self.config.get(key, chat_id)
+        await self.config.set(key, toggled, chat_id)
         return toggled
 
-    # @bot.on_message(chat_command("config"))
+    # router.command("config")
     async def config_command(self, _, message: types.Message):
         if len(message.command) < 2:
-            await message.reply("Не указаны параметры. Параметры для изменения:\n"
-                                f"• {ConfigKey.ANTI_FISHING} — режим анти-рыбалки\n"
-                                f"• {ConfigKey.ANTI_PIPISA_ADS} — режим анти-рекламы пиписы", quote=True)
+            await self._reply(message, "Не указаны параметры. Параметры для изменения:\n"
+                                       f"• {ConfigKey.ANTI_FISHING} — режим анти-рыбалки\n"
+                                       f"• {ConfigKey.ANTI_PIPISA_ADS} — режим анти-рекламы пиписы", quote=True)
             return
 
         match message.command[1]:
             case ConfigKey.ANTI_FISHING:
-                state = self.toggle_config_variable(ConfigKey.ANTI_FISHING)
-                await message.reply(f"Режим анти-рыбалки {'включен' if state else 'отключен'}")
+                state = await self.toggle_config_variable(message.chat.id, ConfigKey.ANTI_FISHING)
+                await self._reply(message, f"Режим анти-рыбалки {'включен' if state else 'отключен'}")
                 return
             case ConfigKey.ANTI_PIPISA_ADS:
-                state = self.toggle_config_variable(ConfigKey.ANTI_PIPISA_ADS)
-                await message.reply(f"Режим анти-рекламы пиписы {'включен' if state else 'отключен'}")
+                state = await self.toggle_config_variable(message.chat.id, ConfigKey.ANTI_PIPISA_ADS)
+                await self._reply(message, f"Режим анти-рекламы пиписы {'включен' if state else 'отключен'}")
                 return
             case _:
                 pass
 
+    async def jobs_command(self, _, message: types.Message):
+        jobs = '\n'.join(f"• {job.name} — через {job.when - asyncio.get_running_loop().time():.0f} с" for job in self.scheduler.jobs)
+        await self._reply(message, f"Запланированные задачи:\n{jobs or '—'}\n\nЗапаздывание:\n{self.scheduler.report() or '—'}", parse_mode=ParseMode.DISABLED)
+
+    async def outbox_command(self, _, message: types.Message):
+        await self._reply(message, f"Очередь исходящих:\n{self.outbox.report()}\n\nМодерация: {self.moderation.report()}",
+                          parse_mode=ParseMode.DISABLED)
+
+    async def perf_command(self, _, message: types.Message):
+        await self._reply(message, f"{metrics.report()}\n\n{self.loop_monitor.report()}\n{inline_query_stats.report()}",
+                          parse_mode=ParseMode.DISABLED)
+
     async def help_command(self, _, message: types.Message):
-        await message.reply("• **/set_nametag** (**/change_nametag**) — установить/изменить плашку\n"
-                            "• **/[un]restrict_member** — запретить/разрешить участнику изменять плашку\n"
-                            "• **/start_crocodile** — начать игру в крокодила\n"
-                            "• **/end_crocodile** — закончить игру в крокодила\n"
-                            "• **@__<группа>__** — упомянуть определенную группу участников\n"
-                            "• **шар** __<вопрос>__ — спросить мнение у шара\n"
-                            "• **амш d20** — кинуть d20\n"
-                            "• **амш кто** __[описание]__ — выбрать случайного участника\n"
-                            "• **амш антипара дня** — выбрать антипару дня\n"
-                            "• **/config** — настроить бота\n"
-                            "• **/help** — эта помощь\n\n"
-                            "||по всем вопросам, замечаниям и предложениям — @sqkrv||", parse_mode=ParseMode.MARKDOWN)
+        await self._reply(message, "• **/set_nametag** (**/change_nametag**) — установить/изменить плашку\n"
+                                   "• **/[un]restrict_member** — запретить/разрешить участнику изменять плашку\n"
+                                   "• **/add_admin**, **/remove_admin** __<участники>__ — назначить/снять администратора бота в этом чате\n"
+                                   "• **/admins** — администраторы бота в этом чате\n"
+                                   "• **/perf** — задержки обработчиков и запросов к Telegram\n"
+                                   "• **/start_crocodile** __[нечетко]__ — начать игру в крокодила (__нечетко__ — засчитывать отгадки с опечатками)\n"
+                                   "• **/end_crocodile** — закончить игру в крокодила\n"
+                                   "• **@__<группа>__** — упомянуть определенную группу участников\n"
+                                   "• **/groups** — список групп для упоминания\n"
+                                   "• **/create_group**, **/delete_group** __<группа>__ — создать/удалить группу\n"
+                                   "• **/add_to_group**, **/remove_from_group** __<группа> <участники>__ — изменить состав группы\n"
+                                   "• **шар** __<вопрос>__ — спросить мнение у шара\n"
+                                   "• **амш d20** — кинуть d20\n"
+                                   "• **амш кто** __[описание]__ — выбрать случайного участника\n"
+                                   "• **амш антипара дня** — выбрать антипару дня\n"
+                                   "• **/triggers** — триггеры на фразы\n"
+                                   "• **/add_trigger_phrase**, **/add_trigger_response** __<триггер> <текст>__ — добавить фразу/ответ триггеру\n"
+                                   "• **/delete_trigger** __<триггер>__ — удалить триггер\n"
+                                   "• **/config** — настроить бота\n"
+                                   "• **/help** — эта помощь\n\n"
+                                   "||по всем вопросам, замечаниям и предложениям — @sqkrv||", parse_mode=ParseMode.MARKDOWN)
 
     async def d20(self, _, message: types.Message):
-        await message.reply(f"{random.choice(['У Вас выпало', 'На ребре', 'Выпало', 'Вы открыли глаза. На ребре'])} **{str(random.randint(1, 20))}**", quote=True, parse_mode=ParseMode.MARKDOWN)
+        await self._reply(message, f"{random.choice(['У Вас выпало', 'На ребре', 'Выпало', 'Вы открыли глаза. На ребре'])} **{str(random.randint(1, 20))}**", quote=True, parse_mode=ParseMode.MARKDOWN)
 
     async def whos_today(self, _, message: types.Message):
-        # random_member = random.choice([member async for member in message.chat.get_members() if not (member.user.username.lower().endswith('bot') if member.user.username else False)])
         random_member = await self._random_members(message.chat)
         if len(message.command) > 2:  # because the first (0) element is 'амш кто'
-            await message.reply(f"{random_member.user.mention} {' '.join(message.command[1:])}")
+            await self._reply(message, f"{random_member.mention} {' '.join(message.command[1:])}")
         else:
-            await message.reply(f"-> {random_member.user.mention} <-")
+            await self._reply(message, f"-> {random_member.mention} <-")
 
     async def antipair(self, _, message: types.Message):
-        antipair_code = str(datetime.today().day) + str(datetime.now().hour // self.ANTIPAIR_TIMEDELTA + 1)
-        if not self.current_antipair or antipair_code != self.current_antipair[0]:
-            random_members = await self._random_members(message.chat, 2)
-            self.current_antipair = (antipair_code, tuple(random_members))
+        state = self.chats.get(message.chat.id)
+        if not state.current_antipair:
+            state.current_antipair = tuple(await self._random_members(message.chat, 2))
         antipair_strings: List[str] = [
-            "💔 {0[0].user.mention} - {0[1].user.mention} 💔",
-            "{0[0].user.mention} + {0[1].user.mention} = 💔",
+            "💔 {0[0].mention} - {0[1].mention} 💔",
+            "{0[0].mention} + {0[1].mention} = 💔",
         ]
         antipair_comments: List[str] = [
-            f"Следующую антипару можно будет выбрать в <b>{(datetime.now().hour // self.ANTIPAIR_TIMEDELTA + 1) * self.ANTIPAIR_TIMEDELTA}:00</b> по МСК",
+            f"Следующую антипару можно будет выбрать в <b>{self.next_antipair_at.hour}:00</b> по МСК",
             "Не стоит вам встречаться",
             "Не водитесь вместе",
             "Будет интересно, если вы уже пара",
             "А пара дня какая?",
             "Чем же вы так не угодили друг другу",
         ]
-        await message.reply("<b>АнтиПара дня</b>\n\n" +
-                            random.choice(antipair_strings).format(self.current_antipair[1]) + '\n\n' +
-                            random.choice(antipair_comments), parse_mode=ParseMode.HTML)
+        await self._reply(message, "<b>АнтиПара дня</b>\n\n" +
+                                   random.choice(antipair_strings).format(state.current_antipair) + '\n\n' +
+                                   random.choice(antipair_comments), parse_mode=ParseMode.HTML)
 
     # region Crocodile game
-    async def _crocodile_new_presenter(self, chat: types.Chat):
-        return await self.bot.send_message(
+    async def _word_history(self, state: ChatState) -> WordHistory:
+        if state.word_history is None:
+            row = await run_db(CrocodileWordHistory.get_or_none, CrocodileWordHistory.chat_id == state.chat_id)
+            state.word_history = WordHistory(len(Words.ALL), bytes(row.used_words) if row else b'')
+        return state.word_history
+
+    async def _save_word_history(self, state: ChatState, force: bool = False):
+        history = state.word_history
+        if history is None or not history.unsaved or (not force and history.unsaved < WordHistory.SAVE_EVERY):
+            return
+        used_words = history.to_bytes()
+        history.unsaved = 0
+        await run_db(CrocodileWordHistory
+                     .insert(chat_id=state.chat_id, used_words=used_words)
+                     .on_conflict(conflict_target=[CrocodileWordHistory.chat_id], update={CrocodileWordHistory.used_words: used_words})
+                     .execute)
+
+    async def _crocodile_pick_word(self, state: ChatState):
+        state.crocodile_game.pick_word()
+        await self._save_word_history(state)
+
+    async def _crocodile_finish(self, state: ChatState):
+        state.crocodile_game.cancel_handoff()
+        state.crocodile_game = None
+        await self._save_word_history(state, force=True)
+
+    def _crocodile_game(self, chat_id: int) -> Optional[CrocodileGame]:
+        return state.crocodile_game if (state := self.chats.peek(chat_id)) else None
+
+    async def _crocodile_new_presenter(self, chat: types.Chat, game: CrocodileGame):
+        return await self.outbox.send_message(
+            self.bot,
             chat.id,
-            f"{self.crocodile_game.presenter.mention} объясняет слово {random.choice(['🤓', '🧐', '🤔'])}",
+            f"{game.presenter.mention} объясняет слово {random.choice(['🤓', '🧐', '🤔'])}",
             reply_markup=pyrogram.types.InlineKeyboardMarkup([
                 [pyrogram.types.InlineKeyboardButton(text="Показать слово", callback_data=CrocodileGame.CallbackQueries.SHOW_WORD)],
                 [pyrogram.types.InlineKeyboardButton(text="Следующее слово", callback_data=CrocodileGame.CallbackQueries.NEXT_WORD)]])
         )
 
     async def crocodile_start(self, _, message: types.Message):
-        if self.crocodile_game:
-            await message.reply("Игра уже идет, присоединяйся!")
+        state = self.chats.get(message.chat.id)
+        history = await self._word_history(state)
+        if state.crocodile_game:
+            await self._reply(message, "Игра уже идет, присоединяйся!")
             return
 
-        self.crocodile_game = CrocodileGame(message.from_user)
-        await self._crocodile_new_presenter(message.chat)
+        fuzzy = any(arg.lower() in CrocodileGame.FUZZY_ARGS for arg in message.command[1:])
+        state.crocodile_game = CrocodileGame(message.chat.id, message.from_user, history, fuzzy=fuzzy)
+        if fuzzy:
+            await self._reply(message, "Опечатки в отгадках засчитываются")
+        await self._crocodile_new_presenter(message.chat, state.crocodile_game)
 
     async def crocodile_show_word(self, _, callback_query: pyrogram.types.CallbackQuery):
-        if self.crocodile_game is None:
+        if (game := self._crocodile_game(callback_query.message.chat.id)) is None:
             await callback_query.answer("Игра не запущена")
             return
 
-        if self.crocodile_game.presenter is None or callback_query.from_user.id != self.crocodile_game.presenter.id:
+        if game.presenter is None or callback_query.from_user.id != game.presenter.id:
             await callback_query.answer("Права не имеешь")
             return
 
-        if callback_query.from_user.id == self.crocodile_game.presenter.id:
-            await callback_query.answer(f"Твое слово: {self.crocodile_game.word}", show_alert=True)
+        await callback_query.answer(f"Твое слово: {game.word}", show_alert=True)
 
     async def crocodile_next_presenter(self, callback_query: types.CallbackQuery = None):
-        if self.crocodile_game is None:
+        state = self.chats.get(callback_query.message.chat.id)
+        if (game := state.crocodile_game) is None:
             await callback_query.answer("Игра не запущена")
             return
 
         author = callback_query.from_user
-        if self.crocodile_game.presenter is None or author.id != self.crocodile_game.presenter.id:
+        if game.presenter is None or author.id != game.presenter.id:
             await callback_query.answer("Права не имеешь")
             return
 
-        self.crocodile_game.presenter = self._random_member(callback_query.message.chat, exclude_ids=[author.id])
-        self.crocodile_game.pick_word()
-        await callback_query.answer(f"Твое новое слово: {self.crocodile_game.word}", show_alert=True)
+        game.presenter = await self._random_members(callback_query.message.chat, exclude_ids=[author.id])
+        await self._crocodile_pick_word(state)
+        await callback_query.answer(f"Твое новое слово: {game.word}", show_alert=True)
 
     async def crocodile_repick_word(self, _, callback_query: pyrogram.types.CallbackQuery):
-        if self.crocodile_game is None:
+        state = self.chats.get(callback_query.message.chat.id)
+        if (game := state.crocodile_game) is None:
             await callback_query.answer("Игра не запущена")
             return
 
         author = callback_query.from_user
-        if self.crocodile_game.presenter is None or author.id != self.crocodile_game.presenter.id:
+        if game.presenter is None or author.id != game.presenter.id:
             await callback_query.answer("Права не имеешь")
             return
 
-        self.crocodile_game.pick_word()
-        await callback_query.answer(f"Твое слово: {self.crocodile_game.word}", show_alert=True)
+        await self._crocodile_pick_word(state)
+        await callback_query.answer(f"Твое слово: {game.word}", show_alert=True)
 
     async def crocodile_become_presenter(self, _, callback_query: types.CallbackQuery):
-        if self.crocodile_game is None:
+        if (game := self._crocodile_game(callback_query.message.chat.id)) is None:
             await callback_query.answer("Игра не запущена")
             return
 
-        if self.crocodile_game.reserved_presenter and callback_query.from_user.id == self.crocodile_game.reserved_presenter.id:
-            self.crocodile_game.presenter = callback_query.from_user
-            self.crocodile_game.reserved_presenter = None
-            await self._crocodile_new_presenter(callback_query.message.chat)
-        elif self.crocodile_game.presenter is None and self.crocodile_game.reserved_presenter is None:
-            self.crocodile_game.presenter = callback_query.from_user
-            await self._crocodile_new_presenter(callback_query.message.chat)
+        if game.reserved_presenter and callback_query.from_user.id == game.reserved_presenter.id:
+            game.finish_handoff(callback_query.from_user)
+            await self._crocodile_new_presenter(callback_query.message.chat, game)
+        elif game.presenter is None and game.reserved_presenter is None:
+            game.finish_handoff(callback_query.from_user)
+            await self._crocodile_new_presenter(callback_query.message.chat, game)
         else:
             await callback_query.answer("Ты не можешь стать ведущим в данный момент")
 
     async def crocodile_end_game(self, _, message: types.Message):
-        if self.crocodile_game is None:
-            await message.reply("Игра и так не начата")
+        state = self.chats.get(message.chat.id)
+        if state.crocodile_game is None:
+            await self._reply(message, "Игра и так не начата")
             return
 
-        self.crocodile_game = None
-        await message.reply("Крокодил закончен")
+        await self._crocodile_finish(state)
+        await self._reply(message, "Крокодил закончен")
+
+    async def _crocodile_abandoned(self, state: ChatState, game: CrocodileGame, message: types.Message):
+        if state.crocodile_game is not game or game.presenter is not None:
+            return
+        await self._crocodile_finish(state)
+        await self._reply(message, "Крокодил закончен")
 
     async def crocodile_messages_listener(self, _, message: types.Message):
         author = message.from_user
-        await message.reply(
+        state = self.chats.get(message.chat.id)
+        game = state.crocodile_game
+        game.start_handoff(self.scheduler, author, lambda: self._crocodile_abandoned(state, game, message))
+        await self._crocodile_pick_word(state)
+        await self._reply(
+            message,
             f"{author.mention} отгадал(а) слово",
             reply_markup=pyrogram.types.InlineKeyboardMarkup([[pyrogram.types.InlineKeyboardButton(text="Принять эстафету", callback_data="become_presenter")]])
         )
-        self.crocodile_game.pick_word()
-        self.crocodile_game.presenter = None
-        self.crocodile_game.reserved_presenter = author
-        _start_time = time.time()
-        while not self.crocodile_game.presenter:
-            _passed = time.time() - _start_time
-            if _passed > CrocodileGame.BECOME_PRESENTER_END_GAME_TIMEOUT:
-                self.crocodile_game = None
-                await message.reply("Крокодил закончен")
-                return
-            elif _passed > CrocodileGame.BECOME_PRESENTER_TIMEOUT:
-                self.crocodile_game.reserved_presenter = None
-            await asyncio.sleep(0.8)
     # endregion
 
-    async def when_photos(self, _, message: types.Message):
-        await message.reply(random.choice([
-            "нахуй иди (за мат извини)", "обещанного три года ждут", "обещанного три года ждут",
-            "обещанного три года ждут, а на четвертый забывают", "в работе",
-            "совсем скоро", "ебать, с первым посвятом было проще, никто так не просил, как вы",
-            "блин, там короче это, ну в общем скоро", "soon™", "фотки? какие фотки?", "бог терпел и вам велел",
-            "Не под дождем — подождем", "Не жди победы, а добивайся", "Все приходит вовремя для того, кто умеет ждать",
-            "сейчас чай допью и будут", "за каждый такой вопрос я удаляю одну фотку с альбома",
-            "иди нахуй (за мат извини)", "██████▓░░░ 69% done", "ඞ", "да, я тратил время на это, а мог бы фотки разбирать"
-        ]))
+    async def trigger_reply(self, _, message: types.Message):
+        if (name := self.triggers.trigger_for(message.matches[0])) and (response := self.triggers.response(name)):
+            await self._reply(message, response)
+
+    def _match_trigger(self, message: types.Message) -> bool:
+        if not message.text or (match := self.triggers.search(message.text)) is None:
+            return False
+        message.matches = [match]
+        return True
+
+    async def triggers_command(self, _, message: types.Message):
+        if not (names := self.triggers.names()):
+            await self._reply(message, "Триггеров нет", quote=True)
+            return
+        await self._reply(message, "Триггеры:\n" + '\n'.join(
+            f"• {name}: {', '.join(phrase for phrase, trigger in self.triggers.phrases.items() if trigger == name)} "
+            f"({len(self.triggers.responses[name])} ответов)" for name in names
+        ), quote=True, parse_mode=ParseMode.DISABLED)
+
+    # router.command(["add_trigger_phrase", "add_trigger_response", "delete_trigger"], <админ>)
+    async def manage_trigger_command(self, _, message: types.Message):
+        """
+        Добавить фразу или ответ триггеру (триггер создается при первом добавлении) либо удалить триггер
+
+        :param message:
+        :return:
+        """
+        if len(message.command) < 2:
+            await self._reply(message, "Не указано название триггера", quote=True)
+            return
+
+        name = message.command[1]
+        text = (message.text or '').split(maxsplit=2)[2:]
+        match message.command[0]:
+            case "delete_trigger":
+                if await self.triggers.delete_trigger(name):
+                    await self._reply(message, f"Триггер {name.lower()} удален", quote=True)
+                else:
+                    await self._reply(message, "Такого триггера нет", quote=True)
+            case "add_trigger_phrase" | "add_trigger_response" if not text:
+                await self._reply(message, "Не указан текст", quote=True)
+            case "add_trigger_phrase":
+                await self.triggers.add_phrase(name, text[0])
+                await self._reply(message, f"Фраза добавлена в триггер {name.lower()}", quote=True)
+            case "add_trigger_response":
+                await self.triggers.add_response(name, text[0])
+                await self._reply(message, f"Ответ добавлен в триггер {name.lower()}", quote=True)
+
+    def _add_handlers(self):
+        if self.recorder:
+            for client in (self.bot, self.selfbot):
+                for handler_class in (MessageHandler, CallbackQueryHandler, ChatMemberUpdatedHandler):
+                    # only the bot's chats: the selfbot is a personal account and also receives private messages
+                    client.add_handler(handler_class(self.recorder.record, update_in_chats), group=-1)
+        self.bot.add_handler(MessageHandler(self.router.dispatch))
+        # region Crocodile game
+        self.bot.add_handler(CallbackQueryHandler(metrics.handler(self.crocodile_show_word), filters.regex(CrocodileGame.CallbackQueries.SHOW_WORD)))
+        self.bot.add_handler(CallbackQueryHandler(metrics.handler(self.crocodile_repick_word), filters.regex(CrocodileGame.CallbackQueries.NEXT_WORD)))
+        self.bot.add_handler(CallbackQueryHandler(metrics.handler(self.crocodile_become_presenter), filters.regex(CrocodileGame.CallbackQueries.BECOME_PRESENTER)))
+        # endregion
+        # region Chat roster
+        self.bot.add_handler(ChatMemberUpdatedHandler(metrics.handler(self.roster_member_updated), filters.chat(CHAT_IDS)))
+        self.bot.add_handler(MessageHandler(metrics.handler(self.roster_service_message), (filters.new_chat_members | filters.left_chat_member) & filters.chat(CHAT_IDS)), group=1)
+        # endregion
+
+        # self.bot.add_handler(MessageHandler(self.send_during_mafia_messages, chat_command("send_mafia_messages")), group=3)
+        # # mafia message - must be the last line
+        # self.bot.add_handler(MessageHandler(
+        #     self.during_mafia_messages,
+        #     filters.create(lambda _, __, m: self.mafia_game_in_progress and (filters.video_note or filters.text or filters.voice) and not any([_ for _ in ["help", "send_mafia_messages"] if _ in m.text]))
+        # ), group=1)
+
+        # selfbot events
+        self.selfbot.add_handler(MessageHandler(metrics.handler(self.fishing_msg_deletion), filters.regex(FISHING_MESSAGE_RE) & filters.user(FISHING_BOT_ID) & filters.chat(CHAT_IDS)))
+        self.selfbot.add_handler(MessageHandler(metrics.handler(self.pipisa_bot_ad_remover), (filters.reply_keyboard | filters.inline_keyboard) & filters.user(PIPISA_BOT_ID) & filters.chat(CHAT_IDS)))
+
+    async def _start_services(self):
+        if self.recorder:
+            self.recorder.start()
+        await run_db(create_schema)
+        await run_db(self.config.load)
+        await self.mention_groups.reload()
+        await self.triggers.reload()
+        await run_db(self.permissions.load)
+        self.loop_monitor.start()
+        self.scheduler.start()
+        self._schedule_jobs()
 
     def run(self):
         async def run():
             self.bot = pyrogram.Client(self.name, self.api_id, self.api_hash, bot_token=self.bot_token)
             self.selfbot = pyrogram.Client(self.name + "_selfbot", self.api_id, self.api_hash)
-            self.bot.add_handler(MessageHandler(self.set_title_command, chat_command(["set_nametag", "change_nametag"])))
-            self.bot.add_handler(MessageHandler(self.un_restrict_member_command, admin_command(["restrict_member", "unrestrict_member"])))
-            self.bot.add_handler(MessageHandler(self.ping_all, text_command(["@все", "@all", "@типавсе"])))
-            self.bot.add_handler(MessageHandler(self.ping_dorm, text_command(["@общажники", "@общага"])))
-            self.bot.add_handler(MessageHandler(self.a8ball, text_command("шар")))
-            self.bot.add_handler(MessageHandler(self.config_command, chat_command("config")))
-            self.bot.add_handler(MessageHandler(self.help_command, filters.command("help")))
-            self.bot.add_handler(MessageHandler(self.d20, amsh_command("d20")))
-            self.bot.add_handler(MessageHandler(self.whos_today, amsh_command("кто")))
-            self.bot.add_handler(MessageHandler(self.antipair, amsh_command("антипара дня")))
-            self.bot.add_handler(MessageHandler(self.when_photos, filters.regex(r"когда фотки|фотки когда", re.IGNORECASE) & filters.chat(CHAT_ID)))
-            # region Crocodile game
-            self.bot.add_handler(MessageHandler(self.crocodile_start, chat_command("start_crocodile")))
-            self.bot.add_handler(CallbackQueryHandler(self.crocodile_show_word, filters.regex(CrocodileGame.CallbackQueries.SHOW_WORD)))
-            self.bot.add_handler(CallbackQueryHandler(self.crocodile_repick_word, filters.regex(CrocodileGame.CallbackQueries.NEXT_WORD)))
-            self.bot.add_handler(CallbackQueryHandler(self.crocodile_become_presenter, filters.regex(CrocodileGame.CallbackQueries.BECOME_PRESENTER)))
-            self.bot.add_handler(MessageHandler(self.crocodile_end_game, chat_command(["end_crocodile", "stop_crocodile"])))
-            self.bot.add_handler(MessageHandler(
-                self.crocodile_messages_listener,
-                filters.create(lambda _, __, m:
-                               self.crocodile_game is not None and filters.text and m.text.lower() == self.crocodile_game.word.lower() and m.from_user.id != self.crocodile_game.presenter.id))
-            )  # crocodile text messages listener
-            # endregion
-
-            # self.bot.add_handler(MessageHandler(self.send_during_mafia_messages, chat_command("send_mafia_messages")), group=3)
-            # # mafia message - must be the last line
-            # self.bot.add_handler(MessageHandler(
-            #     self.during_mafia_messages,
-            #     filters.create(lambda _, __, m: self.mafia_game_in_progress and (filters.video_note or filters.text or filters.voice) and not any([_ for _ in ["help", "send_mafia_messages"] if _ in m.text]))
-            # ), group=1)
-
-            # selfbot events
-            self.selfbot.add_handler(MessageHandler(self.fishing_msg_deletion, filters.regex(r"^🎣 \[Рыбалка\] 🎣") & filters.user(200164142) & filters.chat(CHAT_ID)))
-            self.selfbot.add_handler(MessageHandler(self.pipisa_bot_ad_remover, (filters.reply_keyboard | filters.inline_keyboard) & filters.user(1264548383) & filters.chat(CHAT_ID)))
+            self._add_handlers()
             print("Starting bot(s)...")
             # self.bot.run()
             # self.selfbot.run()
 
             # TODO сохранить все сообщения отправленные и удаленные во время игры в мафию и отправить их потом
-            # TODO усиленный режим анти-рыбалки: если сообщения идут подряд и конечное сообщение с нулевой энергией, то удалить весь тред ссообщений
 
+            await self._start_services()
             await pyrogram.compose([self.bot, self.selfbot])
 
         asyncio.run(run())
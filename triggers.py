@@ -0,0 +1,146 @@
+import asyncio
+import random
+import re
+from typing import Dict, List, Optional, Tuple
+
+from peewee import SQL
+
+from db import db, run_db, Trigger, TriggerPhrase, TriggerResponse
+
+DEFAULT_TRIGGERS: Dict[str, Tuple[List[str], List[str]]] = {
+    "when_photos": (["когда фотки", "фотки когда"], [
+        "нахуй иди (за мат извини)", "обещанного три года ждут", "обещанного три года ждут",
+        "обещанного три года ждут, а на четвертый забывают", "в работе",
+        "совсем скоро", "ебать, с первым посвятом было проще, никто так не просил, как вы",
+        "блин, там короче это, ну в общем скоро", "soon™", "фотки? какие фотки?", "бог терпел и вам велел",
+        "Не под дождем — подождем", "Не жди победы, а добивайся", "Все приходит вовремя для того, кто умеет ждать",
+        "сейчас чай допью и будут", "за каждый такой вопрос я удаляю одну фотку с альбома",
+        "иди нахуй (за мат извини)", "██████▓░░░ 69% done", "ඞ", "да, я тратил время на это, а мог бы фотки разбирать"
+    ]),
+}
+
+
+def normalize_trigger_name(name: str) -> str:
+    return name.strip().lower()
+
+
+def normalize_phrase(phrase: str) -> str:
+    return ' '.join(phrase.lower().split())
+
+
+class TriggerIndex:
+    """
+    Триггеры на свободный текст: фразы (``TriggerPhrase``) и варианты ответа (``TriggerResponse``).
+
+    Все фразы собраны в одно регулярное выражение, поэтому сообщение проверяется
+    одним проходом независимо от числа триггеров. Выражение пересобирается, только
+    если набор фраз и ответов в базе изменился. Пустая таблица ``Trigger``
+    заполняется ``DEFAULT_TRIGGERS``.
+
+    Запросы выполняются в пуле ``run_db``, а индекс меняется только в цикле событий;
+    перезагрузка и изменения идут по очереди под ``_lock``, чтобы перезагрузка,
+    прочитавшая базу до изменения, не затерла его.
+    """
+
+    def __init__(self):
+        self.responses: Dict[str, List[str]] = {}
+        self.phrases: Dict[str, str] = {}  # normalized phrase -> trigger name
+        self.pattern: Optional[re.Pattern] = None
+        self._rows: Optional[List[Tuple[str, str, str]]] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _fetch() -> List[Tuple[str, str, str]]:
+        phrases = (TriggerPhrase
+                   .select(Trigger.name, SQL("'phrase'"), TriggerPhrase.phrase)
+                   .join(Trigger, on=(TriggerPhrase.trigger_id == Trigger.id)))
+        responses = (TriggerResponse
+                     .select(Trigger.name, SQL("'response'"), TriggerResponse.text)
+                     .join(Trigger, on=(TriggerResponse.trigger_id == Trigger.id)))
+        return sorted((phrases + responses).tuples())
+
+    @staticmethod
+    def _seed_defaults():
+        with db.atomic():
+            for name, (phrases, responses) in DEFAULT_TRIGGERS.items():
+                trigger = Trigger.create(name=name)
+                TriggerPhrase.insert_many([{'trigger_id': trigger.id, 'phrase': phrase} for phrase in phrases]).execute()
+                TriggerResponse.insert_many([{'trigger_id': trigger.id, 'text': text} for text in responses]).execute()
+
+    @classmethod
+    def _seed_and_fetch(cls, first_load: bool) -> List[Tuple[str, str, str]]:
+        if first_load and not Trigger.select().exists():
+            cls._seed_defaults()
+        return cls._fetch()
+
+    async def reload(self) -> bool:
+        """Перечитать триггеры; возвращает ``True``, если выражение пришлось пересобрать."""
+        async with self._lock:
+            return self._apply(await run_db(self._seed_and_fetch, self._rows is None))
+
+    def _apply(self, rows: List[Tuple[str, str, str]]) -> bool:
+        if rows == self._rows:
+            return False
+        responses: Dict[str, List[str]] = {}
+        phrases: Dict[str, str] = {}
+        for name, kind, value in rows:
+            if kind == 'phrase':
+                phrases[normalize_phrase(value)] = name
+            else:
+                responses.setdefault(name, []).append(value)
+        phrases = {phrase: name for phrase, name in phrases.items() if phrase and name in responses}
+        # the longest phrase wins when several start at the same position
+        alternatives = sorted(phrases, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(r'\s+'.join(map(re.escape, phrase.split())) for phrase in alternatives),
+                                  re.IGNORECASE) if alternatives else None
+        self.phrases = phrases
+        self.responses = responses
+        self._rows = rows
+        return True
+
+    def search(self, text: str) -> Optional[re.Match]:
+        return self.pattern.search(text) if self.pattern else None
+
+    def trigger_for(self, match: re.Match) -> Optional[str]:
+        return self.phrases.get(normalize_phrase(match.group(0)))
+
+    def response(self, name: str) -> Optional[str]:
+        # a reload may have replaced the index between search() and this call
+        return random.choice(responses) if (responses := self.responses.get(name)) else None
+
+    def names(self) -> List[str]:
+        return sorted(self.responses)
+
+    async def add_phrase(self, name: str, phrase: str):
+        await self._add(TriggerPhrase, name, phrase=normalize_phrase(phrase))
+
+    async def add_response(self, name: str, text: str):
+        await self._add(TriggerResponse, name, text=text)
+
+    @classmethod
+    def _insert(cls, model, name: str, **fields) -> List[Tuple[str, str, str]]:
+        with db.atomic():
+            trigger, _ = Trigger.get_or_create(name=normalize_trigger_name(name))
+            model.create(trigger_id=trigger.id, **fields)
+        return cls._fetch()
+
+    async def _add(self, model, name: str, **fields):
+        async with self._lock:
+            self._apply(await run_db(self._insert, model, name, **fields))
+
+    @classmethod
+    def _delete(cls, name: str) -> Optional[List[Tuple[str, str, str]]]:
+        if (trigger := Trigger.get_or_none(Trigger.name == normalize_trigger_name(name))) is None:
+            return None
+        with db.atomic():
+            TriggerPhrase.delete().where(TriggerPhrase.trigger_id == trigger.id).execute()
+            TriggerResponse.delete().where(TriggerResponse.trigger_id == trigger.id).execute()
+            trigger.delete_instance()
+        return cls._fetch()
+
+    async def delete_trigger(self, name: str) -> bool:
+        async with self._lock:
+            if (rows := await run_db(self._delete, name)) is None:
+                return False
+            self._apply(rows)
+            return True